@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from resilience import CallMetrics
+
+
+class DispatcherBusy(RuntimeError):
+    """Hàng đợi đã đầy (toàn cục hoặc của một session), tin nhắn bị từ chối."""
+
+
+class AssistantDispatcher:
+    """
+    Phục vụ nhiều hội thoại AssistantV2 song song bằng một thread pool.
+
+    Mỗi session có một hàng đợi FIFO riêng và chỉ được xử lý bởi tối đa một worker tại
+    một thời điểm, nên các tin nhắn trên cùng thread chạy tuần tự (API từ chối run song song
+    trên một thread) còn các session khác nhau chạy đồng thời. Worker không bao giờ chờ khoá
+    của session khác: session nào có việc mới được đưa vào pool.
+
+    Backpressure: tối đa max_pending tin nhắn đang chờ/đang chạy và max_pending_per_session
+    cho mỗi session; vượt giới hạn thì submit() chờ tối đa timeout giây rồi raise DispatcherBusy.
+    """
+
+    def __init__(self, assistant, max_workers=8, max_pending=100, max_pending_per_session=10):
+        self.assistant = assistant
+        self.max_pending = max_pending
+        self.max_pending_per_session = max_pending_per_session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="assistant-dispatch")
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._active = set()
+        # Số tin nhắn đã nhận mà chưa xong (đang chờ + đang chạy) của mỗi session
+        self._in_flight = {}
+        self._pending = 0
+        self._closed = False
+        # Thời gian chờ trong hàng đợi và thời gian xử lý của mỗi tin nhắn
+        self.queue_wait = CallMetrics()
+        self.service_time = CallMetrics()
+
+    def _has_capacity(self, session_id):
+        return (self._pending < self.max_pending
+                and self._in_flight.get(session_id, 0) < self.max_pending_per_session)
+
+    def submit(self, session_id, user_message, timeout=0):
+        """
+        Đưa tin nhắn vào hàng đợi của session. Trả về Future với kết quả của generate_response.
+
+        timeout=0 từ chối ngay khi đầy, None chờ tới khi có chỗ.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._closed and not self._has_capacity(session_id):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.queue_wait.incr("rejected")
+                    raise DispatcherBusy(f"Dispatcher is full (session {session_id})")
+                self._condition.wait(remaining)
+            if self._closed:
+                raise RuntimeError("Dispatcher is shut down")
+
+            future = Future()
+            self._queues.setdefault(session_id, deque()).append((user_message, future, time.monotonic()))
+            self._pending += 1
+            self._in_flight[session_id] = self._in_flight.get(session_id, 0) + 1
+            self.queue_wait.incr("submitted")
+            if session_id not in self._active:
+                self._active.add(session_id)
+                self._executor.submit(self._drain, session_id)
+        return future
+
+    def _drain(self, session_id):
+        """Xử lý lần lượt hàng đợi của một session tới khi rỗng."""
+        while True:
+            with self._condition:
+                queue = self._queues.get(session_id)
+                if not queue:
+                    self._queues.pop(session_id, None)
+                    self._active.discard(session_id)
+                    return
+                user_message, future, enqueued_at = queue.popleft()
+
+            started = time.monotonic()
+            self.queue_wait.observe(started - enqueued_at)
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = self.assistant.generate_response(user_message, session_id=session_id)
+                except Exception as e:
+                    self.service_time.incr("failures")
+                    future.set_exception(e)
+                else:
+                    self.service_time.incr("successes" if result is not None else "failures")
+                    future.set_result(result)
+                self.service_time.observe(time.monotonic() - started)
+
+            with self._condition:
+                self._pending -= 1
+                self._in_flight[session_id] -= 1
+                if not self._in_flight[session_id]:
+                    del self._in_flight[session_id]
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            pending = self._pending
+            active_sessions = len(self._active)
+        return {
+            "pending": pending,
+            "active_sessions": active_sessions,
+            "queue_wait": self.queue_wait.snapshot(),
+            "service_time": self.service_time.snapshot(),
+        }
+
+    def shutdown(self, wait=True):
+        """Ngừng nhận tin nhắn mới; các tin nhắn đã nhận vẫn được xử lý."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
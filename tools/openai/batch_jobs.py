@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from openai import OpenAI
+
+from json_stream import extract_json
+from openai_chat import OPENAI_CONFIG, SYSTEM_PROMPT
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchClassifier:
+    """
+    Phân loại hàng loạt tin nhắn (module/keywords/type) qua Batch API.
+
+    Đầu vào được đọc dạng stream và ghi thành các file JSONL theo chunk; mỗi chunk là
+    một batch job. Kết quả được đọc từng dòng và ghi vào bảng message_classification.
+    """
+
+    def __init__(self, client, model, database_path='conversation_history.db',
+                 system_prompt=SYSTEM_PROMPT["1"], chunk_size=1000, work_dir='batch_jobs',
+                 poll_interval=5, max_poll_interval=60):
+        self.client = client
+        self.model = model
+        self.database_path = database_path
+        self.system_prompt = system_prompt
+        self.chunk_size = chunk_size
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._initialize_database()
+
+    def _initialize_database(self):
+        """Tạo bảng lưu kết quả phân loại nếu chưa tồn tại."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS message_classification (
+                custom_id TEXT PRIMARY KEY,
+                source_id INTEGER,
+                user_message TEXT NOT NULL,
+                module TEXT,
+                keywords TEXT,
+                type TEXT,
+                raw_response TEXT,
+                error TEXT,
+                batch_id TEXT,
+                classified_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def iter_inputs_from_file(self, path):
+        """Đọc input từ file: mỗi dòng là text thuần hoặc JSON {"id": ..., "message": ...}."""
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('{'):
+                    item = json.loads(line)
+                    yield f"file-{item.get('id', line_number)}", item.get('id'), item['message']
+                else:
+                    yield f"file-{line_number}", None, line
+
+    def iter_inputs_from_history(self, fetch_size=500):
+        """
+        Đọc các tin nhắn chưa được phân loại từ conversation_history theo từng trang.
+
+        Mỗi trang là một truy vấn ngắn (keyset theo id) và kết nối được đóng trước khi yield,
+        để collect() có thể ghi kết quả vào cùng database trong lúc đang đọc input.
+        """
+        last_id = 0
+        while True:
+            conn = sqlite3.connect(self.database_path)
+            rows = conn.execute('''
+                SELECT id, user_message FROM conversation_history
+                WHERE id > ? AND 'history-' || id NOT IN (SELECT custom_id FROM message_classification)
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, fetch_size)).fetchall()
+            conn.close()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for row_id, user_message in rows:
+                yield f"history-{row_id}", row_id, user_message
+
+    def _request_line(self, custom_id, user_message):
+        return json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": user_message}
+                ],
+                "temperature": 0
+            }
+        }, ensure_ascii=False)
+
+    def write_chunks(self, inputs):
+        """Ghi input thành các file JSONL, mỗi file tối đa chunk_size request. Trả về (path, sources) từng chunk."""
+        chunk_index = 0
+        handle = None
+        sources = {}
+        prefix = time.strftime("%Y%m%d-%H%M%S")
+        for custom_id, source_id, user_message in inputs:
+            if handle is None:
+                chunk_index += 1
+                path = os.path.join(self.work_dir, f"{prefix}-chunk-{chunk_index:04d}.jsonl")
+                handle = open(path, 'w', encoding='utf-8')
+            handle.write(self._request_line(custom_id, user_message) + "\n")
+            sources[custom_id] = (source_id, user_message)
+            if len(sources) >= self.chunk_size:
+                handle.close()
+                yield path, sources
+                handle = None
+                sources = {}
+        if handle is not None:
+            handle.close()
+            yield path, sources
+
+    def submit(self, path):
+        """Upload file JSONL và tạo batch job."""
+        with open(path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata={"source_file": os.path.basename(path)}
+        )
+        print(f"Submitted batch {batch.id} ({os.path.basename(path)})")
+        return batch
+
+    def wait(self, batch_id):
+        """Chờ batch kết thúc, khoảng thời gian poll tăng dần."""
+        interval = self.poll_interval
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_BATCH_STATUSES:
+                return batch
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def collect(self, batch, sources, write_size=500):
+        """
+        Đọc kết quả batch dạng stream và ghi vào SQLite theo từng đợt. Trả về số dòng đã ghi.
+
+        Request lỗi ở mức batch nằm trong error_file_id và được ghi vào cùng bảng dưới dạng dòng lỗi.
+        """
+        file_ids = [file_id for file_id in (batch.output_file_id, batch.error_file_id) if file_id]
+        if not file_ids:
+            print(f"Batch {batch.id} has no output (status: {batch.status})")
+            return 0
+
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        pending = []
+        written = 0
+        for file_id in file_ids:
+            with self.client.files.with_streaming_response.content(file_id) as response:
+                for line in response.iter_lines():
+                    if not line.strip():
+                        continue
+                    pending.append(self._result_row(json.loads(line), sources, batch.id))
+                    if len(pending) >= write_size:
+                        written += self._write_rows(cursor, pending)
+                        conn.commit()
+                        pending = []
+        written += self._write_rows(cursor, pending)
+        conn.commit()
+        conn.close()
+        return written
+
+    def _result_row(self, result, sources, batch_id):
+        custom_id = result.get("custom_id")
+        source_id, user_message = sources.get(custom_id, (None, ""))
+        module = keywords = message_type = raw = error = None
+        response = result.get("response") or {}
+        body = response.get("body") or {}
+        if result.get("error"):
+            error = json.dumps(result["error"], ensure_ascii=False)
+        elif response.get("status_code") != 200 or not body.get("choices"):
+            # Request bị API từ chối: body là object lỗi, không có choices
+            error = json.dumps(body.get("error") or {"status_code": response.get("status_code")},
+                               ensure_ascii=False)
+        else:
+            raw = body["choices"][0]["message"]["content"]
+            try:
+                parsed = extract_json(raw)
+                module = parsed.get("module")
+                keywords = json.dumps(parsed.get("keywords"), ensure_ascii=False)
+                message_type = parsed.get("type")
+            except ValueError as e:
+                error = f"Invalid JSON reply: {str(e)}"
+        return (custom_id, source_id, user_message, module, keywords, message_type, raw, error, batch_id)
+
+    def _write_rows(self, cursor, rows):
+        cursor.executemany('''
+            INSERT OR REPLACE INTO message_classification
+                (custom_id, source_id, user_message, module, keywords, type, raw_response, error, batch_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        return len(rows)
+
+    def run(self, inputs, max_in_flight=4):
+        """Ghi chunk, submit và thu kết quả; tối đa max_in_flight batch chạy cùng lúc."""
+        in_flight = []
+        total = 0
+        for path, sources in self.write_chunks(inputs):
+            in_flight.append((self.submit(path), sources))
+            if len(in_flight) >= max_in_flight:
+                total += self._finish(*in_flight.pop(0))
+        for batch, sources in in_flight:
+            total += self._finish(batch, sources)
+        print(f"Classified {total} messages")
+        return total
+
+    def _finish(self, batch, sources):
+        batch = self.wait(batch.id)
+        written = self.collect(batch, sources)
+        print(f"Batch {batch.id}: {batch.status}, {written} results saved")
+        return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk classify messages with the Batch API')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-i', '--input', help='Input file (plain text or JSONL with "id"/"message")')
+    source.add_argument('--from-history', action='store_true',
+                        help='Classify unclassified rows in conversation_history')
+    parser.add_argument('-d', '--database', default='conversation_history.db', help='SQLite database path')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Requests per batch file (default: 1000)')
+    parser.add_argument('--mock', action='store_true', help='Run against a local mock server (offline)')
+    args = parser.parse_args()
+
+    server = None
+    if args.mock:
+        from mock_openai_server import MockOpenAIServer
+        server = MockOpenAIServer().start()
+        client = OpenAI(api_key="mock", base_url=server.base_url)
+        poll_interval = 0.2
+    else:
+        client = OpenAI(api_key=OPENAI_CONFIG['API_KEY'], base_url=OPENAI_CONFIG['BASE_URL'])
+        poll_interval = 5
+
+    try:
+        classifier = BatchClassifier(client, OPENAI_CONFIG['MODEL'], database_path=args.database,
+                                     chunk_size=args.chunk_size, poll_interval=poll_interval)
+        if args.from_history:
+            inputs = classifier.iter_inputs_from_history()
+        else:
+            inputs = classifier.iter_inputs_from_file(args.input)
+        classifier.run(inputs)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import sqlite3
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+SUMMARY_PROMPT = """
+    Bạn tóm tắt lịch sử hội thoại giữa người dùng và trợ lý IMWS.
+    Giữ lại các thông tin người dùng đã cung cấp (tên, ngày tháng, lý do, yêu cầu đang dở dang) và các quyết định đã thống nhất.
+    Viết ngắn gọn bằng tiếng Việt, không quá {max_tokens} token.
+    """
+
+# Số token cố định cho mỗi message (role, phân tách)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Chi phí ảnh ở chế độ detail "low" và "high" (ảnh đã thu nhỏ về 768px cạnh ngắn)
+IMAGE_TOKENS = 85
+IMAGE_HIGH_DETAIL_TOKENS = 765
+
+
+class TokenEstimator:
+    """Ước lượng số token của văn bản, dùng tiktoken nếu có cài đặt."""
+
+    def __init__(self, model):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+
+    def count(self, text):
+        """Đếm số token của một chuỗi."""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        # Ước lượng thô: tiếng Việt có dấu khoảng 3 ký tự/token
+        return len(text) // 3 + 1
+
+    def count_content(self, content):
+        """Đếm token cho nội dung message (chuỗi hoặc danh sách các phần text/ảnh)."""
+        if isinstance(content, str):
+            return self.count(content)
+        total = 0
+        for part in content or []:
+            if part.get("type") == "text":
+                total += self.count(part.get("text"))
+            elif part.get("type") == "image_url":
+                if part["image_url"].get("detail") == "high":
+                    total += IMAGE_HIGH_DETAIL_TOKENS
+                else:
+                    total += IMAGE_TOKENS
+        return total
+
+    def count_message(self, message):
+        """Đếm token cho một message, bao gồm phần overhead."""
+        return self.count_content(message.get("content")) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder:
+    """Chọn lịch sử hội thoại theo ngân sách token, gộp các lượt cũ vào bản tóm tắt."""
+
+    def __init__(self, client, model, database_path, token_budget=3000,
+                 summary_trigger_tokens=800, summary_max_tokens=300, caller=None):
+        self.client = client
+        self.caller = caller
+        self.model = model
+        self.database_path = database_path
+        self.token_budget = token_budget
+        self.summary_trigger_tokens = summary_trigger_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.estimator = TokenEstimator(model)
+        self._initialize_database()
+
+    def _initialize_database(self):
+        """Tạo bảng lưu bản tóm tắt nếu chưa tồn tại."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_summary (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                summary TEXT NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def load_summary(self):
+        """Lấy bản tóm tắt hiện tại và id của lượt hội thoại cuối cùng đã được tóm tắt."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT summary, last_message_id FROM conversation_summary WHERE id = 1')
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            return "", 0
+        return row[0], row[1]
+
+    def save_summary(self, summary, last_message_id):
+        """Lưu bản tóm tắt mới."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO conversation_summary (id, summary, last_message_id, updated_at)
+            VALUES (1, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(id) DO UPDATE SET
+                summary = excluded.summary,
+                last_message_id = excluded.last_message_id,
+                updated_at = excluded.updated_at
+        ''', (summary, last_message_id))
+        conn.commit()
+        conn.close()
+
+    def clear_summary(self):
+        """Xóa bản tóm tắt (dùng khi xóa toàn bộ lịch sử)."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM conversation_summary')
+        conn.commit()
+        conn.close()
+
+    def _turn_tokens(self, user_message, assistant_response):
+        return (self.estimator.count(user_message) + self.estimator.count(assistant_response)
+                + 2 * MESSAGE_OVERHEAD_TOKENS)
+
+    def build_history(self, reserved_tokens=0):
+        """
+        Trả về (summary, turns) vừa với ngân sách token.
+
+        reserved_tokens là số token đã dùng cho system prompt và tin nhắn hiện tại.
+        Các lượt mới nhất được ưu tiên; các lượt cũ hơn nằm ngoài ngân sách sẽ được
+        gộp vào bản tóm tắt khi đủ summary_trigger_tokens, để không phải gọi tóm tắt mỗi lượt.
+        """
+        summary, summarized_id = self.load_summary()
+        budget = self.token_budget - reserved_tokens - self.estimator.count(summary)
+
+        turns = []
+        # id của lượt mới nhất không còn vừa ngân sách; nó và các lượt cũ hơn cần được tóm tắt
+        overflow_end = None
+
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, user_message, assistant_response FROM conversation_history
+            WHERE id > ?
+            ORDER BY id DESC
+        ''', (summarized_id,))
+        for row_id, user_message, assistant_response in cursor:
+            cost = self._turn_tokens(user_message, assistant_response)
+            if cost > budget:
+                overflow_end = row_id
+                break
+            turns.append({"message": user_message, "response": assistant_response})
+            budget -= cost
+        cursor.close()
+
+        overflow = []
+        overflow_tokens = 0
+        if overflow_end is not None:
+            # Tóm tắt từ lượt cũ nhất chưa tóm tắt trở đi, giới hạn lượng văn bản mỗi lần;
+            # phần còn lại được tóm tắt ở các lượt sau
+            overflow_limit = self.summary_trigger_tokens * 4
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_message, assistant_response FROM conversation_history
+                WHERE id > ? AND id <= ?
+                ORDER BY id ASC
+            ''', (summarized_id, overflow_end))
+            for row in cursor:
+                overflow.append(row)
+                overflow_tokens += self._turn_tokens(row[1], row[2])
+                if overflow_tokens >= overflow_limit:
+                    break
+            cursor.close()
+        conn.close()
+
+        if overflow and overflow_tokens >= self.summary_trigger_tokens:
+            new_summary = self._summarize(summary, overflow)
+            # Tóm tắt lỗi (hết deadline, circuit breaker mở) không làm hỏng câu trả lời: giữ bản
+            # tóm tắt cũ cùng các lượt vừa ngân sách, lần sau tóm tắt lại từ summarized_id cũ
+            if new_summary:
+                summary = new_summary
+                self.save_summary(summary, overflow[-1][0])
+
+        return summary, turns[::-1]  # Đảo ngược thứ tự
+
+    def _call(self, fn, *args, **kwargs):
+        if self.caller is not None:
+            return self.caller.call(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    def _summarize(self, summary, rows):
+        """Gộp bản tóm tắt cũ với các lượt hội thoại cũ thành bản tóm tắt mới (None nếu lỗi)."""
+        transcript = "\n".join(
+            f"User: {user_message}\nAssistant: {assistant_response}"
+            for _, user_message, assistant_response in rows
+        )
+        content = f"Tóm tắt trước đó:\n{summary}\n\nHội thoại mới:\n{transcript}" if summary else transcript
+        try:
+            response = self._call(
+                self.client.chat.completions.create,
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=self.summary_max_tokens)},
+                    {"role": "user", "content": content}
+                ],
+                temperature=0,
+                max_tokens=self.summary_max_tokens
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error summarizing history: {str(e)}")
+            return None
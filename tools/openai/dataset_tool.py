@@ -0,0 +1,465 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from context_builder import TokenEstimator
+from openai_chat import OPENAI_CONFIG, SYSTEM_PROMPT
+
+VALID_ROLES = {"system", "user", "assistant", "tool"}
+# Giới hạn token cho một ví dụ khi fine-tune gpt-4o-mini
+DEFAULT_MAX_EXAMPLE_TOKENS = 65536
+# MinHash: 32 giá trị, chia 8 band x 4 dòng cho LSH
+MINHASH_SIZE = 32
+LSH_BANDS = 8
+SHINGLE_SIZE = 3
+_mask_random = random.Random(20240101)
+MINHASH_MASKS = tuple(_mask_random.getrandbits(32) for _ in range(MINHASH_SIZE))
+
+_estimators = {}
+
+
+def _estimator(model):
+    """Mỗi process worker tạo TokenEstimator một lần."""
+    if model not in _estimators:
+        _estimators[model] = TokenEstimator(model)
+    return _estimators[model]
+
+
+def iter_line_chunks(path, chunk_size):
+    """Đọc file JSONL theo từng chunk (line_no, line), không nạp cả file vào bộ nhớ."""
+    chunk = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            chunk.append((line_no, line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalize_text(text):
+    return " ".join(text.casefold().split())
+
+
+def minhash_signature(text):
+    """Chữ ký MinHash trên shingle 3 từ: mỗi shingle băm một lần (crc32), mỗi hàm băm là XOR với một mask."""
+    words = text.split()
+    hashes = [zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+              for i in range(max(1, len(words) - SHINGLE_SIZE + 1))]
+    return tuple(min(map(mask.__xor__, hashes)) for mask in MINHASH_MASKS)
+
+
+def check_messages(messages):
+    """Kiểm tra schema và thứ tự role của một ví dụ. Trả về (errors, warnings)."""
+    errors = []
+    warnings = []
+    if not isinstance(messages, list) or not messages:
+        return ["'messages' must be a non-empty list"], warnings
+
+    roles = []
+    for index, message in enumerate(messages):
+        if not isinstance(message, dict):
+            errors.append(f"message {index} is not an object")
+            continue
+        role = message.get("role")
+        if role not in VALID_ROLES:
+            errors.append(f"message {index} has invalid role {role!r}")
+        content = message.get("content")
+        if not isinstance(content, str) and not (role == "assistant" and message.get("tool_calls")):
+            errors.append(f"message {index} content must be a string")
+        elif isinstance(content, str) and not content.strip():
+            warnings.append(f"message {index} has empty content")
+        unknown = set(message) - {"role", "content", "name", "weight", "tool_calls", "tool_call_id"}
+        if unknown:
+            errors.append(f"message {index} has unknown keys {sorted(unknown)}")
+        roles.append(role)
+
+    if "assistant" not in roles:
+        errors.append("no assistant message")
+    elif roles[-1] != "assistant":
+        warnings.append("last message is not from the assistant")
+    first_other = next((i for i, role in enumerate(roles) if role != "system"), len(roles))
+    if "system" in roles[first_other:]:
+        warnings.append("system message after the conversation started")
+    if "user" not in roles:
+        warnings.append("no user message")
+    for previous, current in zip(roles[first_other:], roles[first_other + 1:]):
+        if previous == current and current in ("user", "assistant"):
+            warnings.append(f"consecutive {current} messages")
+            break
+    return errors, warnings
+
+
+def check_example(line, model):
+    """Kiểm tra một dòng JSONL: lỗi, cảnh báo, số token, hash chính xác và chữ ký MinHash."""
+    result = {"errors": [], "warnings": [], "tokens": 0, "digest": None, "signature": None}
+    try:
+        example = json.loads(line)
+    except ValueError as e:
+        result["errors"].append(f"invalid JSON: {str(e)}")
+        return result
+    if not isinstance(example, dict) or "messages" not in example:
+        result["errors"].append("missing 'messages'")
+        return result
+
+    messages = example["messages"]
+    result["errors"], result["warnings"] = check_messages(messages)
+    if result["errors"]:
+        return result
+
+    estimator = _estimator(model)
+    # 3 token mở đầu phần trả lời của assistant, như cách OpenAI tính cho chat
+    result["tokens"] = sum(estimator.count_message(message) for message in messages) + 3
+    normalized = [(message["role"], normalize_text(message.get("content") or "")) for message in messages]
+    result["digest"] = hashlib.blake2b(json.dumps(normalized, ensure_ascii=False).encode('utf-8'),
+                                       digest_size=16).digest()
+    # Chữ ký gần trùng chỉ dựa trên phần hội thoại (system prompt thường giống nhau giữa các ví dụ)
+    dialogue = " ".join(text for role, text in normalized if role != "system")
+    result["signature"] = minhash_signature(dialogue or " ".join(text for _, text in normalized))
+    return result
+
+
+def _check_chunk(args):
+    chunk, model = args
+    return [(line_no, line, check_example(line, model)) for line_no, line in chunk]
+
+
+class DuplicateIndex:
+    """
+    Phát hiện trùng lặp chính xác (hash) và gần trùng (MinHash + LSH banding).
+
+    Chỉ giữ digest 16 byte và chữ ký đã đóng gói (128 byte) cho mỗi ví dụ không trùng.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.digests = {}
+        self.bands = [{} for _ in range(LSH_BANDS)]
+        self.rows = MINHASH_SIZE // LSH_BANDS
+
+    def add(self, line_no, digest, signature):
+        """Ghi nhận một ví dụ. Trả về ('exact'|'near', line_no gốc, độ giống) hoặc None."""
+        original = self.digests.get(digest)
+        if original is not None:
+            return "exact", original, 1.0
+        self.digests[digest] = line_no
+
+        packed = struct.pack(f'<{MINHASH_SIZE}I', *signature)
+        band_bytes = self.rows * 4
+        keys = [packed[band * band_bytes:(band + 1) * band_bytes] for band in range(LSH_BANDS)]
+        best = None
+        for band, key in enumerate(keys):
+            candidate = self.bands[band].get(key)
+            if candidate is None:
+                continue
+            candidate_line, candidate_packed = candidate
+            candidate_signature = struct.unpack(f'<{MINHASH_SIZE}I', candidate_packed)
+            similarity = sum(a == b for a, b in zip(signature, candidate_signature)) / MINHASH_SIZE
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = ("near", candidate_line, similarity)
+        if best is None:
+            for band, key in enumerate(keys):
+                self.bands[band].setdefault(key, (line_no, packed))
+        return best
+
+
+class TokenStats:
+    """Tổng hợp số token với bộ nhớ cố định (reservoir sample cho phân vị)."""
+
+    def __init__(self, sample_size=10000):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.sample_size = sample_size
+        self.sample = []
+
+    def add(self, tokens):
+        self.count += 1
+        self.total += tokens
+        self.minimum = tokens if self.minimum is None else min(self.minimum, tokens)
+        self.maximum = tokens if self.maximum is None else max(self.maximum, tokens)
+        if len(self.sample) < self.sample_size:
+            self.sample.append(tokens)
+        else:
+            index = random.randrange(self.count)
+            if index < self.sample_size:
+                self.sample[index] = tokens
+
+    def percentile(self, percent):
+        if not self.sample:
+            return None
+        samples = sorted(self.sample)
+        return samples[min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))]
+
+    def report(self):
+        return {
+            "total": self.total,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": round(self.total / self.count, 1) if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+def validate_file(path, model=OPENAI_CONFIG['MODEL'], workers=None, chunk_size=2000,
+                  max_tokens=DEFAULT_MAX_EXAMPLE_TOKENS, near_threshold=0.8,
+                  output_path=None, max_issues=20):
+    """
+    Kiểm tra một file dataset và trả về thống kê.
+
+    Các chunk được xử lý song song (tối đa 2 chunk/worker đang chờ để giữ bộ nhớ cố định);
+    kết quả được gộp theo đúng thứ tự dòng. Nếu có output_path, ghi các ví dụ hợp lệ,
+    không trùng lặp và không vượt max_tokens ra file đó.
+    """
+    workers = workers or os.cpu_count() or 1
+    duplicates = DuplicateIndex(near_threshold)
+    tokens = TokenStats()
+    stats = {
+        "file": path,
+        "examples": 0,
+        "valid": 0,
+        "invalid": 0,
+        "with_warnings": 0,
+        "exact_duplicates": 0,
+        "near_duplicates": 0,
+        "over_token_limit": 0,
+        "written": 0,
+        "issues": [],
+    }
+
+    def record_issue(line_no, kind, detail):
+        if len(stats["issues"]) < max_issues:
+            stats["issues"].append({"line": line_no, "kind": kind, "detail": detail})
+
+    output = open(output_path, 'w', encoding='utf-8') if output_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            chunks = iter_line_chunks(path, chunk_size)
+            while True:
+                while len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.append(executor.submit(_check_chunk, (chunk, model)))
+                if not pending:
+                    break
+                for line_no, line, result in pending.popleft().result():
+                    stats["examples"] += 1
+                    if result["errors"]:
+                        stats["invalid"] += 1
+                        record_issue(line_no, "error", "; ".join(result["errors"]))
+                        continue
+                    stats["valid"] += 1
+                    if result["warnings"]:
+                        stats["with_warnings"] += 1
+                        record_issue(line_no, "warning", "; ".join(result["warnings"]))
+                    tokens.add(result["tokens"])
+                    keep = True
+                    if result["tokens"] > max_tokens:
+                        stats["over_token_limit"] += 1
+                        record_issue(line_no, "too_long", f"{result['tokens']} tokens")
+                        keep = False
+                    duplicate = duplicates.add(line_no, result["digest"], result["signature"])
+                    if duplicate:
+                        kind, original, similarity = duplicate
+                        stats[f"{kind}_duplicates"] += 1
+                        record_issue(line_no, f"{kind}_duplicate",
+                                     f"of line {original} (similarity {similarity:.2f})")
+                        keep = False
+                    if keep and output:
+                        output.write(line if line.endswith("\n") else line + "\n")
+                        stats["written"] += 1
+    finally:
+        if output:
+            output.close()
+    stats["tokens"] = tokens.report()
+    return stats
+
+
+class HistoryExporter:
+    """
+    Xuất conversation_history sang định dạng dataset fine-tune theo từng đợt.
+
+    Vị trí đã xuất (id lớn nhất) và kích thước file tương ứng của mỗi file đích được lưu trong
+    bảng dataset_export_state, nên mỗi lần chạy chỉ nối thêm các dòng mới vào cuối file. Phần
+    file sau kích thước đã lưu được đối chiếu với các dòng lẽ ra được xuất tiếp (xem
+    _recover_tail), nên đợt của lần chạy bị ngắt không bị xuất lặp và dòng thêm bằng tay
+    không bị xoá.
+    """
+
+    def __init__(self, database_path, system_prompt=SYSTEM_PROMPT["1"], batch_size=1000):
+        self.database_path = database_path
+        self.system_prompt = " ".join(system_prompt.split())
+        self.batch_size = batch_size
+        self._initialize_database()
+
+    def _initialize_database(self):
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dataset_export_state (
+                output_path TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                output_size INTEGER,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _format_example(self, user_message, assistant_response, require_json):
+        """Dòng JSONL của một lượt hội thoại, None nếu lượt này bị bỏ qua."""
+        if require_json:
+            try:
+                json.loads(assistant_response)
+            except ValueError:
+                return None
+        example = {"messages": [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_response},
+        ]}
+        return json.dumps(example, ensure_ascii=False) + "\n"
+
+    def _recover_tail(self, conn, output_path, offset, last_id, require_json):
+        """
+        Đối chiếu phần file sau offset với các dòng lẽ ra được xuất sau last_id.
+
+        Dòng trùng khớp thuộc đợt của lần chạy trước bị ngắt trước khi lưu vị trí: giữ lại và
+        tiến last_id qua chúng. Dòng ghi dở ở cuối file chỉ bị cắt khi nó là phần đầu của dòng
+        kế tiếp; các dòng khác (vd. thêm bằng tay) được giữ nguyên. Trả về (last_id, số dòng khớp).
+        """
+        rows = conn.execute('''
+            SELECT id, user_message, assistant_response FROM conversation_history WHERE id > ? ORDER BY id
+        ''', (last_id,))
+
+        def expected_lines():
+            for row_id, user_message, assistant_response in rows:
+                line = self._format_example(user_message, assistant_response, require_json)
+                if line is not None:
+                    yield row_id, line.encode('utf-8')
+
+        expected = expected_lines()
+        pending = next(expected, None)
+        recovered = 0
+        torn_at = None
+        with open(output_path, 'rb') as f:
+            f.seek(offset)
+            position = offset
+            for line in f:
+                if pending is None:
+                    break
+                if line == pending[1]:
+                    last_id = pending[0]
+                    recovered += 1
+                    pending = next(expected, None)
+                elif not line.endswith(b"\n") and pending[1].startswith(line):
+                    torn_at = position
+                position += len(line)
+        rows.close()
+        if torn_at is not None:
+            os.truncate(output_path, torn_at)
+        return last_id, recovered
+
+    def _save_state(self, conn, key, last_id, output_size):
+        conn.execute('''
+            INSERT OR REPLACE INTO dataset_export_state (output_path, last_id, output_size, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (key, last_id, output_size))
+        conn.commit()
+
+    def export(self, output_path, require_json=True):
+        """Nối các dòng lịch sử mới vào output_path. Trả về thống kê của lần chạy."""
+        key = os.path.abspath(output_path)
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT last_id, output_size FROM dataset_export_state WHERE output_path = ?', (key,))
+        row = cursor.fetchone()
+        last_id = row[0] if row else 0
+        stats = {"exported": 0, "skipped": 0, "recovered": 0, "last_id": last_id}
+
+        if row and row[1] is not None and os.path.exists(output_path) and os.path.getsize(output_path) > row[1]:
+            last_id, stats["recovered"] = self._recover_tail(conn, output_path, row[1], last_id, require_json)
+            self._save_state(conn, key, last_id, os.path.getsize(output_path))
+
+        with open(output_path, 'a', encoding='utf-8') as f:
+            while True:
+                cursor.execute('''
+                    SELECT id, user_message, assistant_response FROM conversation_history
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, self.batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for row_id, user_message, assistant_response in rows:
+                    line = self._format_example(user_message, assistant_response, require_json)
+                    if line is None:
+                        stats["skipped"] += 1
+                        continue
+                    f.write(line)
+                    stats["exported"] += 1
+                last_id = rows[-1][0]
+                # Ghi xuống đĩa trước khi lưu vị trí để không mất dòng khi bị ngắt
+                f.flush()
+                os.fsync(f.fileno())
+                self._save_state(conn, key, last_id, os.fstat(f.fileno()).st_size)
+        conn.close()
+        stats["last_id"] = last_id
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate, deduplicate and export fine-tuning datasets')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    validate_parser = subparsers.add_parser('validate', help='Validate JSONL dataset files')
+    validate_parser.add_argument('files', nargs='+', help='JSONL files to check')
+    validate_parser.add_argument('-m', '--model', default=OPENAI_CONFIG['MODEL'], help='Model for token counting')
+    validate_parser.add_argument('-w', '--workers', type=int, help='Worker processes (default: CPU count)')
+    validate_parser.add_argument('--chunk-size', type=int, default=2000, help='Lines per chunk (default: 2000)')
+    validate_parser.add_argument('--max-tokens', type=int, default=DEFAULT_MAX_EXAMPLE_TOKENS,
+                                 help='Token limit per example')
+    validate_parser.add_argument('--near-threshold', type=float, default=0.8,
+                                 help='Estimated Jaccard similarity for near duplicates (default: 0.8)')
+    validate_parser.add_argument('-o', '--output',
+                                 help='Write clean examples here (only with a single input file)')
+    validate_parser.add_argument('--max-issues', type=int, default=20, help='Issues listed per file')
+
+    export_parser = subparsers.add_parser('export', help='Append new conversation history to a dataset file')
+    export_parser.add_argument('output', help='Dataset JSONL file to append to')
+    export_parser.add_argument('-d', '--database', default='conversation_history.db', help='SQLite database path')
+    export_parser.add_argument('--system-prompt', choices=sorted(SYSTEM_PROMPT), default="1",
+                               help='SYSTEM_PROMPT key used as the system message (default: 1)')
+    export_parser.add_argument('--allow-non-json', action='store_true',
+                               help='Also export replies that are not valid JSON')
+    args = parser.parse_args()
+
+    if args.command == 'validate':
+        if args.output and len(args.files) > 1:
+            parser.error('--output needs a single input file')
+        for path in args.files:
+            stats = validate_file(path, model=args.model, workers=args.workers, chunk_size=args.chunk_size,
+                                  max_tokens=args.max_tokens, near_threshold=args.near_threshold,
+                                  output_path=args.output, max_issues=args.max_issues)
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        exporter = HistoryExporter(args.database, system_prompt=SYSTEM_PROMPT[args.system_prompt])
+        stats = exporter.export(args.output, require_json=not args.allow_non_json)
+        print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from openai import OpenAI
+
+TERMINAL_JOB_STATUSES = {"succeeded", "failed", "cancelled"}
+
+
+class FineTuneMonitor:
+    """
+    Theo dõi fine-tuning job với cache SQLite.
+
+    - iter_jobs(): phân trang lười (newest-first), dừng ngay khi gặp job đã kết thúc có sẵn
+      trong cache vì các job cũ hơn không còn thay đổi; trong list_ttl giây đọc thẳng từ cache.
+      Lần duyệt dừng giữa chừng vẫn lưu phần đã duyệt, lần sau đọc cache tới đó rồi hỏi tiếp API.
+    - get_job(): job đã kết thúc luôn lấy từ cache, job đang chạy chỉ gọi API khi quá job_ttl giây.
+    - iter_new_events(): chỉ lấy các event mới hơn event cuối cùng đã lưu (cursor theo id).
+    - follow(): poll một job đang chạy với khoảng thời gian tăng dần khi không có gì mới.
+    """
+
+    def __init__(self, client, database_path, caller=None, list_ttl=300, job_ttl=30, page_size=20):
+        self.client = client
+        self.database_path = database_path
+        self.caller = caller
+        self.list_ttl = list_ttl
+        self.job_ttl = job_ttl
+        self.page_size = page_size
+        self._initialize_database()
+
+    def _initialize_database(self):
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.executescript('''
+            CREATE TABLE IF NOT EXISTS finetune_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                model TEXT,
+                fine_tuned_model TEXT,
+                created_at INTEGER NOT NULL,
+                finished_at INTEGER,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_finetune_jobs_created_at ON finetune_jobs (created_at);
+            CREATE INDEX IF NOT EXISTS idx_finetune_jobs_status ON finetune_jobs (status);
+
+            CREATE TABLE IF NOT EXISTS finetune_job_events (
+                id TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                level TEXT,
+                message TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_finetune_job_events_job
+                ON finetune_job_events (job_id, created_at);
+
+            CREATE TABLE IF NOT EXISTS finetune_sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at REAL NOT NULL
+            );
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _call(self, fn, *args, **kwargs):
+        if self.caller is not None:
+            return self.caller.call(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    def _save_jobs(self, cursor, jobs):
+        now = time.time()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO finetune_jobs
+                (id, status, model, fine_tuned_model, created_at, finished_at, data, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(job.id, job.status, job.model, job.fine_tuned_model, job.created_at, job.finished_at,
+               job.model_dump_json(), now) for job in jobs])
+
+    def _job_to_dict(self, job):
+        data = json.loads(job.model_dump_json())
+        data["fetched_at"] = time.time()
+        return data
+
+    def _row_to_job(self, row):
+        job = json.loads(row[0])
+        job["fetched_at"] = row[1]
+        return job
+
+    def _list_sync_state(self, cursor):
+        """
+        (updated_at, boundary) của lần duyệt danh sách gần nhất.
+
+        Cache liền mạch từ job mới nhất tới job boundary (created_at, id); boundary None nghĩa là
+        liền mạch tới job cũ nhất.
+        """
+        cursor.execute("SELECT updated_at, value FROM finetune_sync_state WHERE key = 'jobs_list'")
+        row = cursor.fetchone()
+        if not row:
+            return None, None
+        return row[0], tuple(json.loads(row[1])) if row[1] else None
+
+    def _save_list_state(self, conn, boundary, synced):
+        value = json.dumps(list(boundary)) if boundary else None
+        if synced:
+            conn.execute('''
+                INSERT OR REPLACE INTO finetune_sync_state (key, value, updated_at)
+                VALUES ('jobs_list', ?, ?)
+            ''', (value, time.time()))
+        else:
+            # Chỉ nối dài phần cache liền mạch, các job mới nhất không được hỏi lại nên giữ nguyên updated_at
+            conn.execute("UPDATE finetune_sync_state SET value = ? WHERE key = 'jobs_list'", (value,))
+        conn.commit()
+
+    def iter_jobs(self, refresh=False):
+        """Duyệt job từ mới đến cũ (dict), chỉ gọi API cho các trang có thể đã thay đổi."""
+        conn = sqlite3.connect(self.database_path)
+        try:
+            yield from self._iter_jobs(conn, refresh)
+        finally:
+            conn.close()
+
+    def _iter_api_jobs(self, conn, after, synced_at, boundary, yielded):
+        """
+        Duyệt API từ sau job `after` (None = từ job mới nhất), trả về (oldest_created_at, boundary) khi xong.
+
+        Mỗi trang được lưu cùng trạng thái đồng bộ trước khi trả job của trang đó, nên người gọi
+        dừng giữa chừng (vd. islice) không làm mất tiến độ.
+        """
+        cursor = conn.cursor()
+        from_top = after is None
+        oldest_created_at = None
+        while True:
+            params = {"limit": self.page_size}
+            if after:
+                params["after"] = after
+            page = self._call(self.client.fine_tuning.jobs.list, **params)
+            jobs = page.data
+            anchors = set()
+            if jobs and from_top and synced_at is not None:
+                ids = [job.id for job in jobs]
+                cursor.execute(f'''
+                    SELECT id, status, fetched_at, created_at FROM finetune_jobs
+                    WHERE id IN ({",".join("?" * len(ids))})
+                ''', ids)
+                # Chỉ job đã có từ lần duyệt trước và nằm trong phần cache liền mạch mới đảm bảo
+                # các job cũ hơn (tới boundary) đều có trong cache
+                anchors = {
+                    job_id for job_id, status, fetched_at, created_at in cursor.fetchall()
+                    if fetched_at <= synced_at and status in TERMINAL_JOB_STATUSES
+                    and (boundary is None or (created_at, job_id) >= boundary)
+                }
+            self._save_jobs(cursor, jobs)
+            # Từ job anchor trở về trước cache đã đầy đủ tới boundary cũ
+            reached_cache = any(job.id in anchors and job.status in TERMINAL_JOB_STATUSES for job in jobs)
+            done = reached_cache or not jobs or not page.has_more
+            if not reached_cache:
+                boundary = None if done else (jobs[-1].created_at, jobs[-1].id)
+            self._save_list_state(conn, boundary, synced=from_top)
+
+            for job in jobs:
+                oldest_created_at = job.created_at
+                if job.id in yielded:
+                    continue
+                yielded.add(job.id)
+                yield self._job_to_dict(job)
+            if done:
+                return oldest_created_at, boundary
+            after = jobs[-1].id
+
+    def _iter_jobs(self, conn, refresh):
+        cursor = conn.cursor()
+        synced_at, boundary = self._list_sync_state(cursor)
+        fresh = synced_at is not None and time.time() - synced_at < self.list_ttl
+        oldest_created_at = None
+        yielded = set()
+
+        if refresh or not fresh:
+            oldest_created_at, boundary = yield from self._iter_api_jobs(conn, None, synced_at, boundary, yielded)
+
+        # Phần còn lại (hoặc toàn bộ nếu cache còn mới) đọc từ SQLite theo trang (keyset created_at, id)
+        # tới boundary, sau boundary cache có thể có khoảng trống nên hỏi tiếp API
+        position = None
+        reached_boundary = False
+        while not reached_boundary:
+            if position is None and oldest_created_at is None:
+                cursor.execute('''
+                    SELECT data, fetched_at, created_at, id FROM finetune_jobs
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (self.page_size,))
+            elif position is None:
+                # Các job cùng giây với job cuối của API có thể chưa được trả về
+                cursor.execute('''
+                    SELECT data, fetched_at, created_at, id FROM finetune_jobs
+                    WHERE created_at <= ? ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (oldest_created_at, self.page_size))
+            else:
+                cursor.execute('''
+                    SELECT data, fetched_at, created_at, id FROM finetune_jobs
+                    WHERE created_at < ? OR (created_at = ? AND id < ?)
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (position[0], position[0], position[1], self.page_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for row in rows:
+                if boundary is not None and (row[2], row[3]) < boundary:
+                    reached_boundary = True
+                    break
+                if row[3] in yielded:
+                    continue
+                yielded.add(row[3])
+                job = self._row_to_job(row)
+                if job["status"] not in TERMINAL_JOB_STATUSES and time.time() - job["fetched_at"] >= self.job_ttl:
+                    # Job cũ nhưng chưa kết thúc: chỉ job này mới cần hỏi lại API
+                    job = self.get_job(job["id"])
+                yield job
+            position = (rows[-1][2], rows[-1][3])
+
+        if boundary is not None:
+            yield from self._iter_api_jobs(conn, boundary[1], synced_at, boundary, yielded)
+
+    def get_job(self, job_id, max_age=None):
+        """Trạng thái một job: job đã kết thúc hoặc còn mới trong cache thì không gọi API."""
+        max_age = self.job_ttl if max_age is None else max_age
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT data, fetched_at, status FROM finetune_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row and (row[2] in TERMINAL_JOB_STATUSES or time.time() - row[1] < max_age):
+            conn.close()
+            return self._row_to_job(row)
+
+        job = self._call(self.client.fine_tuning.jobs.retrieve, job_id)
+        self._save_jobs(cursor, [job])
+        conn.commit()
+        conn.close()
+        return self._job_to_dict(job)
+
+    def refresh_active(self):
+        """Cập nhật các job chưa kết thúc trong cache (quá job_ttl giây). Trả về danh sách job đã cập nhật."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id FROM finetune_jobs
+            WHERE status NOT IN ({",".join("?" * len(TERMINAL_JOB_STATUSES))}) AND fetched_at < ?
+        ''', [*TERMINAL_JOB_STATUSES, time.time() - self.job_ttl])
+        job_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return [self.get_job(job_id, max_age=0) for job_id in job_ids]
+
+    def iter_new_events(self, job_id):
+        """Các event chưa lưu của job, theo thứ tự thời gian. API trả event mới nhất trước."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id FROM finetune_job_events WHERE job_id = ? ORDER BY created_at DESC, rowid DESC LIMIT 1
+        ''', (job_id,))
+        row = cursor.fetchone()
+        last_seen = row[0] if row else None
+
+        new_events = []
+        after = None
+        while True:
+            params = {"limit": self.page_size}
+            if after:
+                params["after"] = after
+            page = self._call(self.client.fine_tuning.jobs.list_events, job_id, **params)
+            reached = False
+            for event in page.data:
+                if event.id == last_seen:
+                    reached = True
+                    break
+                new_events.append(event)
+            if reached or not page.has_more or not page.data:
+                break
+            after = page.data[-1].id
+
+        new_events.reverse()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO finetune_job_events (id, job_id, created_at, level, message)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(event.id, job_id, event.created_at, event.level, event.message) for event in new_events])
+        conn.commit()
+        conn.close()
+        for event in new_events:
+            yield {"id": event.id, "created_at": event.created_at, "level": event.level, "message": event.message}
+
+    def cached_events(self, job_id):
+        """Các event đã lưu của job, theo thứ tự thời gian."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, created_at, level, message FROM finetune_job_events
+            WHERE job_id = ? ORDER BY created_at, rowid
+        ''', (job_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [{"id": row[0], "created_at": row[1], "level": row[2], "message": row[3]} for row in rows]
+
+    def follow(self, job_id, on_event=print, initial_interval=5, max_interval=60):
+        """Theo dõi job tới khi kết thúc; khoảng poll tăng gấp đôi khi không có event/trạng thái mới."""
+        interval = initial_interval
+        status = None
+        while True:
+            changed = False
+            for event in self.iter_new_events(job_id):
+                on_event(event)
+                changed = True
+            job = self.get_job(job_id, max_age=0)
+            if job["status"] != status:
+                status = job["status"]
+                changed = True
+            if status in TERMINAL_JOB_STATUSES:
+                for event in self.iter_new_events(job_id):
+                    on_event(event)
+                return job
+            interval = initial_interval if changed else min(interval * 2, max_interval)
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List and follow fine-tuning jobs')
+    parser.add_argument('-d', '--database', default='conversation_history.db', help='SQLite cache path')
+    parser.add_argument('-n', '--limit', type=int, default=20, help='Jobs to list (default: 20)')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the list freshness window')
+    parser.add_argument('--follow', metavar='JOB_ID', help='Stream events of a job until it finishes')
+    parser.add_argument('--interval', type=float, default=5, help='Initial poll interval for --follow')
+    args = parser.parse_args()
+
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+    monitor = FineTuneMonitor(client, args.database)
+    if args.follow:
+        job = monitor.follow(args.follow, on_event=lambda event: print(f"[{event['level']}] {event['message']}"),
+                             initial_interval=args.interval)
+        print(f"{job['id']}: {job['status']} {job.get('fine_tuned_model') or ''}")
+        return
+    for index, job in enumerate(monitor.iter_jobs(refresh=args.refresh)):
+        if index >= args.limit:
+            break
+        print(f"{job['id']}  {job['status']:<10}  {job['model']}  {job.get('fine_tuned_model') or ''}")
+
+
+if __name__ == "__main__":
+    main()
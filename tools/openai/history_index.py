@@ -0,0 +1,252 @@
+import re
+import sqlite3
+from datetime import date, timedelta
+
+from json_stream import extract_json
+
+
+def extract_tags(assistant_response):
+    """
+    Lấy (module, type, keywords) từ phản hồi JSON của trợ lý.
+
+    Hỗ trợ cả 'keywords' (SYSTEM_PROMPT["1"]) lẫn 'key' (SYSTEM_PROMPT["0"]), dạng list hoặc chuỗi
+    phân tách bằng dấu phẩy. JSON có thể nằm trong code fence ```json; phản hồi không chứa
+    object JSON thì trả về (None, None, []).
+    """
+    try:
+        data = extract_json(assistant_response)
+    except (TypeError, ValueError):
+        return None, None, []
+
+    raw_keywords = data.get('keywords', data.get('key')) or []
+    if isinstance(raw_keywords, str):
+        raw_keywords = raw_keywords.split(',')
+    keywords = []
+    for keyword in raw_keywords:
+        if not isinstance(keyword, str):
+            continue
+        normalized = " ".join(keyword.casefold().split())
+        if normalized and normalized not in keywords:
+            keywords.append(normalized)
+
+    module = data.get('module')
+    if module in (None, '', 'None'):
+        module = None
+    return module, data.get('type'), keywords
+
+
+def fts_query(text):
+    """Chuyển chuỗi người dùng nhập thành truy vấn FTS5 an toàn (mỗi từ là một cụm trong dấu nháy)."""
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    return " ".join(terms)
+
+
+class HistoryIndex:
+    """
+    Chỉ mục tìm kiếm và thống kê cho bảng conversation_history.
+
+    - conversation_fts: bảng FTS5 (external content) trên user_message/assistant_response,
+      được đồng bộ bằng trigger nên mọi thao tác insert/delete đều cập nhật chỉ mục.
+    - conversation_tags / conversation_keywords: module, type và từ khoá đã chuẩn hoá,
+      ghi cùng transaction với save_to_database.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self._initialize_database()
+
+    def _initialize_database(self):
+        """Tạo bảng FTS, bảng từ khoá, trigger; lập chỉ mục cho dữ liệu cũ ở lần tạo đầu tiên."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversation_fts'")
+        is_new = cursor.fetchone() is None
+
+        cursor.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversation_fts USING fts5(
+                user_message,
+                assistant_response,
+                content='conversation_history',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+
+            CREATE TABLE IF NOT EXISTS conversation_tags (
+                conversation_id INTEGER PRIMARY KEY,
+                module TEXT,
+                type TEXT,
+                created_at DATETIME NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversation_tags_module
+                ON conversation_tags (module, created_at);
+            CREATE INDEX IF NOT EXISTS idx_conversation_tags_created_at
+                ON conversation_tags (created_at, module, type);
+
+            CREATE TABLE IF NOT EXISTS conversation_keywords (
+                conversation_id INTEGER NOT NULL,
+                keyword TEXT NOT NULL,
+                created_at DATETIME NOT NULL,
+                PRIMARY KEY (conversation_id, keyword)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_conversation_keywords_keyword
+                ON conversation_keywords (keyword, created_at);
+            CREATE INDEX IF NOT EXISTS idx_conversation_keywords_created_at
+                ON conversation_keywords (created_at);
+
+            CREATE TRIGGER IF NOT EXISTS conversation_history_ai AFTER INSERT ON conversation_history BEGIN
+                INSERT INTO conversation_fts (rowid, user_message, assistant_response)
+                VALUES (new.id, new.user_message, new.assistant_response);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS conversation_history_ad AFTER DELETE ON conversation_history BEGIN
+                INSERT INTO conversation_fts (conversation_fts, rowid, user_message, assistant_response)
+                VALUES ('delete', old.id, old.user_message, old.assistant_response);
+                DELETE FROM conversation_tags WHERE conversation_id = old.id;
+                DELETE FROM conversation_keywords WHERE conversation_id = old.id;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS conversation_history_au AFTER UPDATE ON conversation_history BEGIN
+                INSERT INTO conversation_fts (conversation_fts, rowid, user_message, assistant_response)
+                VALUES ('delete', old.id, old.user_message, old.assistant_response);
+                INSERT INTO conversation_fts (rowid, user_message, assistant_response)
+                VALUES (new.id, new.user_message, new.assistant_response);
+            END;
+        ''')
+
+        if is_new:
+            self._backfill(conn)
+        conn.commit()
+        conn.close()
+
+    def _backfill(self, conn, batch_size=1000):
+        """Lập chỉ mục cho các dòng đã có trước khi bật chỉ mục."""
+        conn.execute("INSERT INTO conversation_fts (conversation_fts) VALUES ('rebuild')")
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, assistant_response, timestamp FROM conversation_history
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            cursor = conn.cursor()
+            for row_id, assistant_response, timestamp in rows:
+                self.index_response(cursor, row_id, assistant_response, timestamp)
+            last_id = rows[-1][0]
+
+    def index_response(self, cursor, conversation_id, assistant_response, created_at=None):
+        """
+        Ghi module/type/từ khoá của một dòng hội thoại.
+
+        Dùng cursor của save_to_database để ghi trong cùng transaction với dòng lịch sử.
+        """
+        module, message_type, keywords = extract_tags(assistant_response)
+        if module is None and message_type is None and not keywords:
+            return
+        if created_at is None:
+            cursor.execute('SELECT timestamp FROM conversation_history WHERE id = ?', (conversation_id,))
+            row = cursor.fetchone()
+            created_at = row[0] if row else None
+        cursor.execute('''
+            INSERT OR REPLACE INTO conversation_tags (conversation_id, module, type, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (conversation_id, module, message_type, created_at))
+        cursor.executemany('''
+            INSERT OR IGNORE INTO conversation_keywords (conversation_id, keyword, created_at)
+            VALUES (?, ?, ?)
+        ''', [(conversation_id, keyword, created_at) for keyword in keywords])
+
+    def search(self, text, limit=20, offset=0):
+        """Tìm kiếm toàn văn (không phân biệt dấu) trong tin nhắn và phản hồi, xếp hạng theo bm25."""
+        query = fts_query(text)
+        if not query:
+            return []
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT h.id, h.user_message, h.assistant_response, h.timestamp
+            FROM conversation_fts
+            JOIN conversation_history h ON h.id = conversation_fts.rowid
+            WHERE conversation_fts MATCH ?
+            ORDER BY conversation_fts.rank
+            LIMIT ? OFFSET ?
+        ''', (query, limit, offset))
+        rows = cursor.fetchall()
+        conn.close()
+        return [{"id": row[0], "message": row[1], "response": row[2], "timestamp": row[3]} for row in rows]
+
+    def _time_filter(self, column, start, end):
+        """
+        Điều kiện start <= column < end. end chỉ có ngày (YYYY-MM-DD) được tính trọn ngày đó,
+        vì người dùng nhập "Đến ngày" theo nghĩa bao gồm ngày cuối.
+        """
+        if end and re.fullmatch(r'\d{4}-\d{2}-\d{2}', end):
+            end = (date.fromisoformat(end) + timedelta(days=1)).isoformat()
+        clauses = []
+        params = []
+        if start:
+            clauses.append(f"{column} >= ?")
+            params.append(start)
+        if end:
+            clauses.append(f"{column} < ?")
+            params.append(end)
+        return clauses, params
+
+    def keyword_counts(self, start=None, end=None, module=None, limit=20):
+        """Đếm số hội thoại theo từ khoá trong khoảng thời gian từ start tới end."""
+        clauses, params = self._time_filter("k.created_at", start, end)
+        join = ""
+        if module:
+            join = "JOIN conversation_tags t ON t.conversation_id = k.conversation_id"
+            clauses.append("t.module = ?")
+            params.append(module)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT k.keyword, COUNT(*) AS total FROM conversation_keywords k
+            {join}
+            {where}
+            GROUP BY k.keyword
+            ORDER BY total DESC, k.keyword
+            LIMIT ?
+        ''', params + [limit])
+        rows = cursor.fetchall()
+        conn.close()
+        return [{"keyword": row[0], "count": row[1]} for row in rows]
+
+    def module_counts(self, start=None, end=None):
+        """Đếm số hội thoại theo module (và type) trong khoảng thời gian từ start tới end."""
+        clauses, params = self._time_filter("created_at", start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT COALESCE(module, 'None'), type, COUNT(*) AS total FROM conversation_tags
+            {where}
+            GROUP BY module, type
+            ORDER BY total DESC
+        ''', params)
+        rows = cursor.fetchall()
+        conn.close()
+        return [{"module": row[0], "type": row[1], "count": row[2]} for row in rows]
+
+    def keyword_timeline(self, keyword, start=None, end=None, bucket='day'):
+        """Số lần xuất hiện của một từ khoá theo ngày/tháng."""
+        formats = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'month': '%Y-%m'}
+        if bucket not in formats:
+            raise ValueError(f"Unsupported bucket: {bucket}")
+        clauses, params = self._time_filter("created_at", start, end)
+        clauses.insert(0, "keyword = ?")
+        params.insert(0, " ".join(keyword.casefold().split()))
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT strftime('{formats[bucket]}', created_at) AS period, COUNT(*) FROM conversation_keywords
+            WHERE {' AND '.join(clauses)}
+            GROUP BY period
+            ORDER BY period
+        ''', params)
+        rows = cursor.fetchall()
+        conn.close()
+        return [{"period": row[0], "count": row[1]} for row in rows]
@@ -0,0 +1,151 @@
+import json
+from dataclasses import dataclass, field
+
+REPLY_TYPES = {'assist', 'advance_assist'}
+
+
+class IncrementalJSONExtractor:
+    """
+    Đọc object JSON trong phản hồi được stream theo từng đoạn text.
+
+    Bỏ qua mọi ký tự trước dấu '{' đầu tiên và sau dấu '}' đóng object (code fence ```json,
+    câu dẫn, ...), nên không cần strip() phản hồi. Mỗi trường cấp một được trả về ngay khi
+    giá trị của nó hoàn tất, nhờ đó có thể xử lý 'type'/'module'/'action' trước khi
+    'response' được sinh xong.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def feed(self, text):
+        """Thêm một đoạn text, trả về list (key, value) của các trường vừa hoàn tất."""
+        if self.done or not text:
+            return []
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            index = self._pos
+            self._pos += 1
+
+            if not self._started:
+                if char == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key = json.loads(buffer[self._key_start:index + 1])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None:
+                    self._key_start = index
+            elif char == ':' and self._depth == 1 and self._value_start is None:
+                self._value_start = self._pos
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_field(buffer[self._value_start:index] if self._value_start is not None else None,
+                                         completed)
+                    self.done = True
+                    break
+            elif char == ',' and self._depth == 1:
+                self._complete_field(buffer[self._value_start:index], completed)
+        return completed
+
+    def _complete_field(self, raw_value, completed):
+        if self._key is not None and raw_value is not None:
+            value = json.loads(raw_value)
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def result(self):
+        """Object JSON hoàn chỉnh; raise ValueError nếu phản hồi không chứa object hợp lệ."""
+        if not self._started:
+            raise ValueError("No JSON object in reply")
+        if not self.done:
+            raise ValueError("Incomplete JSON object in reply")
+        return dict(self.fields)
+
+
+def extract_json(text):
+    """Lấy object JSON từ một phản hồi đầy đủ (có hoặc không có code fence)."""
+    extractor = IncrementalJSONExtractor()
+    extractor.feed(text)
+    return extractor.result()
+
+
+@dataclass
+class AssistantReply:
+    """Phản hồi có cấu trúc của trợ lý (định dạng SYSTEM_PROMPT["1"], chấp nhận cả 'key' của prompt "0")."""
+
+    response: str
+    type: str = 'assist'
+    module: str = None
+    keywords: list = field(default_factory=list)
+    action: object = None
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Kiểm tra và chuẩn hoá dict đã parse; raise ValueError nếu sai định dạng."""
+        if not isinstance(data, dict):
+            raise ValueError("Reply is not a JSON object")
+        data = dict(data)
+        response = data.pop('response', None)
+        if not isinstance(response, str):
+            raise ValueError("Reply has no 'response' string")
+        reply_type = data.pop('type', None) or 'assist'
+        if reply_type not in REPLY_TYPES:
+            raise ValueError(f"Unknown reply type: {reply_type}")
+        module = data.pop('module', None)
+        if module in ('', 'None'):
+            module = None
+        keywords = data.pop('keywords', data.pop('key', None)) or []
+        if isinstance(keywords, str):
+            keywords = [keyword.strip() for keyword in keywords.split(',') if keyword.strip()]
+        if not isinstance(keywords, list):
+            raise ValueError("'keywords' must be a list or a comma separated string")
+        action = data.pop('action', None) or None
+        return cls(response=response, type=reply_type, module=module, keywords=keywords,
+                   action=action, extra=data)
+
+    @classmethod
+    def from_text(cls, text):
+        return cls.from_dict(extract_json(text))
+
+    def to_dict(self):
+        data = {
+            "module": self.module if self.module is not None else 'None',
+            "keywords": self.keywords,
+            "type": self.type,
+            "response": self.response,
+            "action": self.action if self.action is not None else "",
+        }
+        data.update(self.extra)
+        return data
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from mock_openai_server import MockOpenAIServer, add_latency_arguments, latency_options
+
+SAMPLE_MESSAGES = [
+    "Tôi muốn tạo giấy nghỉ phép từ ngày mai",
+    "Hướng dẫn giao việc cho nhân viên",
+    "Làm sao để đăng bài tuyển dụng?",
+    "Xem hợp đồng của dự án A",
+    "Hôm nay thời tiết thế nào?",
+]
+
+
+def percentile(samples, percent):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+class SQLiteContention:
+    """Đo thời gian ghi lịch sử vào SQLite và số lần bị 'database is locked' khi chạy song song."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.write_times = []
+        self.lock_errors = 0
+
+    def wrap(self, bot):
+        original = bot.save_to_database
+
+        def timed_save(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if "locked" in str(e):
+                    with self.lock:
+                        self.lock_errors += 1
+                raise
+            finally:
+                with self.lock:
+                    self.write_times.append(time.perf_counter() - started)
+
+        bot.save_to_database = timed_save
+        return bot
+
+    def report(self):
+        with self.lock:
+            times = list(self.write_times)
+            lock_errors = self.lock_errors
+        return {
+            "writes": len(times),
+            "mean_ms": round(sum(times) / len(times) * 1000, 3) if times else None,
+            "p99_ms": round(percentile(times, 99) * 1000, 3) if times else None,
+            "max_ms": round(max(times) * 1000, 3) if times else None,
+            "lock_errors": lock_errors,
+        }
+
+
+def _timed(fn, message):
+    started = time.perf_counter()
+    result = fn(message)
+    return time.perf_counter() - started, result is not None
+
+
+def run_chat(server, args, contention):
+    """Nhiều luồng dùng chung một ChatBot, giống một backend phục vụ nhiều request."""
+    from openai_chat import OPENAI_CONFIG, ChatBot
+
+    config = dict(OPENAI_CONFIG, API_KEY="mock", BASE_URL=server.base_url, ATTACHMENTS=[])
+    bot = contention.wrap(ChatBot(config))
+    messages = [SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)] for i in range(args.requests)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda message: _timed(bot.generate_response, message), messages))
+    return results, bot.caller.metrics.snapshot()
+
+
+def run_assistant(server, args, contention):
+    """Mỗi worker có một AssistantV2 với thread riêng (API không cho chạy song song trên cùng thread)."""
+    from openai_assistant import OPENAI_CONFIG, AssistantV2
+
+    client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+    config = dict(OPENAI_CONFIG)
+    assistants = []
+    for _ in range(args.concurrency):
+        assistant = contention.wrap(AssistantV2(client=client, config=config))
+        assistant.thread_id = client.beta.threads.create().id
+        if assistants:
+            # Dùng chung ResilientCaller để metrics và circuit breaker tính trên toàn bộ tải
+            assistant.caller = assistants[0].caller
+        assistants.append(assistant)
+
+    def worker(index):
+        results = []
+        for i in range(index, args.requests, args.concurrency):
+            results.append(_timed(assistants[index].generate_response, SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]))
+        return results
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = [result for chunk in executor.map(worker, range(args.concurrency)) for result in chunk]
+    return results, assistants[0].caller.metrics.snapshot()
+
+
+def run_dispatcher(server, args, contention):
+    """Một AssistantV2 phục vụ nhiều session qua AssistantDispatcher (tuần tự trong từng session)."""
+    from assistant_dispatcher import AssistantDispatcher
+    from openai_assistant import OPENAI_CONFIG, AssistantV2
+
+    client = OpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+    assistant = contention.wrap(AssistantV2(client=client, config=dict(OPENAI_CONFIG)))
+    with AssistantDispatcher(assistant, max_workers=args.concurrency,
+                             max_pending=args.requests, max_pending_per_session=args.requests) as dispatcher:
+        submitted = []
+        for i in range(args.requests):
+            session_id = f"session-{i % args.sessions}"
+            submitted.append((time.perf_counter(), dispatcher.submit(session_id, SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)])))
+        results = []
+        for started, future in submitted:
+            result = future.result()
+            # Độ trễ tính từ lúc submit, gồm cả thời gian chờ trong hàng đợi của session
+            results.append((time.perf_counter() - started, result is not None))
+        metrics = assistant.caller.metrics.snapshot()
+        metrics["dispatcher"] = dispatcher.stats()
+    return results, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test ChatBot / AssistantV2 against a local mock server')
+    parser.add_argument('-t', '--target', choices=['chat', 'assistant', 'dispatcher'], default='chat')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='Total requests (default: 200)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='Concurrent workers (default: 8)')
+    parser.add_argument('-s', '--sessions', type=int, default=16, help='Sessions for the dispatcher target (default: 16)')
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    runner = {'chat': run_chat, 'assistant': run_assistant, 'dispatcher': run_dispatcher}[args.target]
+    contention = SQLiteContention()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir, MockOpenAIServer(**latency_options(args)) as server:
+        # ChatBot/AssistantV2 dùng đường dẫn database tương đối, chạy trong thư mục tạm
+        os.chdir(work_dir)
+        try:
+            started = time.perf_counter()
+            results, caller_metrics = runner(server, args, contention)
+            duration = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+        server_counts = dict(server.state.request_counts)
+
+    latencies = [latency for latency, ok in results if ok]
+    report = {
+        "target": args.target,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(results) / duration, 2) if duration else None,
+        "succeeded": len(latencies),
+        "failed": len(results) - len(latencies),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+            "p99": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+            "max": round(max(latencies) * 1000, 1) if latencies else None,
+        },
+        "sqlite": contention.report(),
+        "caller": caller_metrics,
+        "server_requests": server_counts,
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
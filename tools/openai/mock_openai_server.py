@@ -0,0 +1,856 @@
+import argparse
+import email
+import email.policy
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Máy chủ giả lập một phần OpenAI API để chạy thử offline, không tốn chi phí API.
+# Dùng: OpenAI(api_key="mock", base_url=server.base_url)
+
+MOCK_MODULES = {
+    "project_manager": ["dự án", "hợp đồng", "hoá đơn", "hóa đơn", "đơn mua"],
+    "public_apps": ["nghỉ phép", "công tác", "tạm ứng", "hoàn ứng", "thông báo"],
+    "work_manager": ["công việc", "giao việc", "báo cáo"],
+    "archive": ["lưu trữ", "file", "tài liệu"],
+    "quotation_requests": ["chào giá", "mua hàng"],
+    "job_posting": ["tuyển dụng", "cv", "ứng tuyển"],
+}
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def mock_classification(text):
+    """Phân loại giả lập theo từ khoá, trả về JSON cùng định dạng với SYSTEM_PROMPT["1"]."""
+    lowered = (text or "").lower()
+    module = "None"
+    keywords = []
+    for module_id, words in MOCK_MODULES.items():
+        matched = [word for word in words if word in lowered]
+        if matched:
+            module = module_id
+            keywords = matched
+            break
+    return json.dumps({
+        "module": module,
+        "keywords": keywords,
+        "type": "assist",
+        "response": f"Mock response: {text[:50]}" if text else "Mock response",
+        "action": ""
+    }, ensure_ascii=False)
+
+
+def _last_user_text(messages):
+    for message in reversed(messages or []):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        return " ".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+    return ""
+
+
+class LatencyModel:
+    """Phân phối độ trễ giả lập: 'fixed', 'uniform' hoặc 'lognormal' (đuôi dài giống API thật)."""
+
+    def __init__(self, distribution="fixed", mean=0.0, spread=0.0):
+        if distribution not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unsupported latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean = mean
+        self.spread = spread
+
+    def sample(self):
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return max(0.0, random.uniform(self.mean - self.spread, self.mean + self.spread))
+        if self.distribution == "lognormal":
+            # spread là sigma của log; giữ kỳ vọng bằng mean
+            sigma = self.spread
+            return random.lognormvariate(math.log(self.mean) - sigma ** 2 / 2, sigma)
+        return self.mean
+
+
+def _prompt_tokens(messages):
+    return sum(len(json.dumps(m, ensure_ascii=False)) // 4 for m in messages or [])
+
+
+def chat_completion_body(request_body, cached_tokens=0):
+    """Tạo object chat.completion giả lập cho một request."""
+    content = mock_classification(_last_user_text(request_body.get("messages")))
+    prompt_tokens = _prompt_tokens(request_body.get("messages"))
+    completion_tokens = len(content) // 4
+    return {
+        "id": _new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request_body.get("model", "mock-model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+    }
+
+
+class MockOpenAIState:
+    """Dữ liệu in-memory của máy chủ giả lập."""
+
+    def __init__(self, batch_delay=0.5, latency=None, error_rate=0.0, error_status=429,
+                 retry_after=None, stream_chunk_size=16, stream_chunk_delay=0.0,
+                 finetune_jobs=0, finetune_step_delay=1.0, finetune_steps=5):
+        self.lock = threading.Lock()
+        self.batch_delay = batch_delay
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_chunk_delay = stream_chunk_delay
+        self.files = {}
+        self.file_contents = {}
+        self.batches = {}
+        self.threads = {}
+        self.messages = {}
+        self.runs = {}
+        # Fine-tuning job, sắp xếp theo thứ tự tạo; job đang chạy tiến thêm một bước mỗi finetune_step_delay giây
+        self.finetune_step_delay = finetune_step_delay
+        self.finetune_steps = finetune_steps
+        self.finetune_jobs = {}
+        self.finetune_events = {}
+        for index in range(finetune_jobs):
+            self.create_finetune_job(status="succeeded" if index % 5 else "failed",
+                                     created_at=int(time.time()) - (finetune_jobs - index) * 3600)
+        # thread_id -> run_id của run đang queued/in_progress
+        self.active_runs = {}
+        # Prefix (system message đầu tiên) đã gặp, dùng để giả lập prompt caching
+        self.seen_prefixes = set()
+        self.request_counts = {}
+
+    def count_request(self, name):
+        with self.lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def cached_tokens(self, messages):
+        """Giả lập prompt caching: prefix đã gặp thì tính là cache hit."""
+        if not messages:
+            return 0
+        prefix = json.dumps(messages[0], ensure_ascii=False, sort_keys=True)
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        with self.lock:
+            hit = key in self.seen_prefixes
+            self.seen_prefixes.add(key)
+        return len(prefix) // 4 if hit else 0
+
+    def create_thread(self, metadata=None):
+        thread = {
+            "id": _new_id("thread"),
+            "object": "thread",
+            "created_at": int(time.time()),
+            "metadata": metadata or {},
+            "tool_resources": None
+        }
+        with self.lock:
+            self.threads[thread["id"]] = thread
+            self.messages[thread["id"]] = []
+        return thread
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            deleted = self.threads.pop(thread_id, None) is not None
+            self.messages.pop(thread_id, None)
+        return {"id": thread_id, "object": "thread.deleted", "deleted": deleted}
+
+    def create_message(self, thread_id, role, content, run_id=None, assistant_id=None):
+        message = {
+            "id": _new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "run_id": run_id,
+            "assistant_id": assistant_id,
+            "attachments": [],
+            "metadata": {},
+            "status": "completed"
+        }
+        with self.lock:
+            self.messages[thread_id].append(message)
+        return message
+
+    def active_run(self, thread_id):
+        with self.lock:
+            run_id = self.active_runs.get(thread_id)
+            return dict(self.runs[run_id]) if run_id else None
+
+    def create_run(self, thread_id, assistant_id):
+        """Tạo run mới; trả về None nếu thread đang có run chưa kết thúc (giống API thật)."""
+        run = {
+            "id": _new_id("run"),
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "status": "queued",
+            "model": "mock-model",
+            "instructions": "",
+            "tools": [],
+            "started_at": None,
+            "completed_at": None,
+            "last_error": None,
+            "usage": None
+        }
+        with self.lock:
+            if thread_id in self.active_runs:
+                return None
+            self.runs[run["id"]] = run
+            self.active_runs[thread_id] = run["id"]
+        return dict(run)
+
+    def run_reply(self, thread_id):
+        """Nội dung trả lời của run: phân loại tin nhắn user mới nhất trong thread."""
+        with self.lock:
+            messages = list(self.messages.get(thread_id, []))
+        for message in reversed(messages):
+            if message["role"] == "user":
+                return mock_classification(message["content"][0]["text"]["value"])
+        return mock_classification("")
+
+    def update_run(self, run_id, **fields):
+        with self.lock:
+            run = self.runs[run_id]
+            run.update(fields)
+            if run["status"] not in ("queued", "in_progress"):
+                self.active_runs.pop(run["thread_id"], None)
+            return dict(run)
+
+    def complete_run_later(self, run_id):
+        """Run không stream: hoàn tất ở nền sau một khoảng trễ."""
+        def worker():
+            run = self.update_run(run_id, status="in_progress", started_at=int(time.time()))
+            time.sleep(self.latency.sample())
+            self.create_message(run["thread_id"], "assistant", self.run_reply(run["thread_id"]),
+                                run_id=run_id, assistant_id=run["assistant_id"])
+            self.update_run(run_id, status="completed", completed_at=int(time.time()))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def create_finetune_job(self, status="running", model="gpt-4o-mini-2024-07-18", created_at=None):
+        """Tạo fine-tuning job; status khác 'running' tạo job đã kết thúc (lịch sử cũ)."""
+        created_at = created_at or int(time.time())
+        job = {
+            "id": _new_id("ftjob"),
+            "object": "fine_tuning.job",
+            "created_at": created_at,
+            "model": model,
+            "status": status,
+            "fine_tuned_model": f"ft:{model}:mock::{uuid.uuid4().hex[:8]}" if status == "succeeded" else None,
+            "finished_at": created_at + 600 if status != "running" else None,
+            "error": None,
+            "hyperparameters": {"n_epochs": 3},
+            "organization_id": "org-mock",
+            "result_files": [],
+            "seed": 0,
+            "trained_tokens": None,
+            "training_file": "file-mock",
+            "validation_file": None,
+            "_steps_done": 0
+        }
+        with self.lock:
+            self.finetune_jobs[job["id"]] = job
+            self.finetune_events[job["id"]] = []
+            self._add_finetune_event(job, created_at, "Created fine-tuning job")
+            if status != "running":
+                self._add_finetune_event(job, job["finished_at"], f"Job {status}")
+        return self.finetune_job(job["id"])
+
+    def _add_finetune_event(self, job, created_at, message, level="info"):
+        self.finetune_events[job["id"]].append({
+            "id": _new_id("ftevent"),
+            "object": "fine_tuning.job.event",
+            "created_at": created_at,
+            "level": level,
+            "message": message,
+            "type": "message"
+        })
+
+    def _advance_finetune_job(self, job):
+        """Cập nhật tiến độ job đang chạy theo thời gian đã trôi qua (gọi khi giữ lock)."""
+        if job["status"] != "running":
+            return
+        steps = min(self.finetune_steps, int((time.time() - job["created_at"]) / self.finetune_step_delay))
+        while job["_steps_done"] < steps:
+            job["_steps_done"] += 1
+            self._add_finetune_event(job, int(time.time()),
+                                     f"Step {job['_steps_done']}/{self.finetune_steps}: training loss=0.{9 - job['_steps_done']}")
+        if job["_steps_done"] >= self.finetune_steps:
+            job.update({
+                "status": "succeeded",
+                "finished_at": int(time.time()),
+                "trained_tokens": 1000 * self.finetune_steps,
+                "fine_tuned_model": f"ft:{job['model']}:mock::{uuid.uuid4().hex[:8]}"
+            })
+            self._add_finetune_event(job, job["finished_at"], "The job has successfully completed")
+
+    def finetune_job(self, job_id):
+        with self.lock:
+            job = self.finetune_jobs.get(job_id)
+            if job is None:
+                return None
+            self._advance_finetune_job(job)
+            return {key: value for key, value in job.items() if not key.startswith("_")}
+
+    def list_finetune_jobs(self):
+        """Tất cả job, mới nhất trước."""
+        with self.lock:
+            job_ids = [job["id"] for job in sorted(self.finetune_jobs.values(),
+                                                  key=lambda job: job["created_at"], reverse=True)]
+        return [self.finetune_job(job_id) for job_id in job_ids]
+
+    def list_finetune_events(self, job_id):
+        """Event của job, mới nhất trước."""
+        with self.lock:
+            job = self.finetune_jobs.get(job_id)
+            if job is None:
+                return None
+            self._advance_finetune_job(job)
+            return list(reversed(self.finetune_events[job_id]))
+
+    def create_file(self, filename, purpose, content):
+        file_object = {
+            "id": _new_id("file"),
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self.lock:
+            self.files[file_object["id"]] = file_object
+            self.file_contents[file_object["id"]] = content
+        return file_object
+
+    def create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        batch = {
+            "id": _new_id("batch"),
+            "object": "batch",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "metadata": metadata,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+        threading.Thread(target=self._run_batch, args=(batch["id"],), daemon=True).start()
+        return batch
+
+    def _run_batch(self, batch_id):
+        """Xử lý batch ở nền: validating -> in_progress -> completed."""
+        time.sleep(self.batch_delay / 2)
+        with self.lock:
+            batch = self.batches[batch_id]
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+            content = self.file_contents.get(batch["input_file_id"], b"")
+
+        output_lines = []
+        error_lines = []
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                output_lines.append(json.dumps({
+                    "id": _new_id("batch_req"),
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": uuid.uuid4().hex,
+                        "body": chat_completion_body(request["body"])
+                    },
+                    "error": None
+                }, ensure_ascii=False))
+            except (ValueError, KeyError) as e:
+                error_lines.append(json.dumps({
+                    "id": _new_id("batch_req"),
+                    "custom_id": None,
+                    "response": None,
+                    "error": {"code": "invalid_request", "message": str(e)}
+                }))
+
+        time.sleep(self.batch_delay / 2)
+        output_file = self.create_file("batch_output.jsonl", "batch_output",
+                                       "\n".join(output_lines).encode("utf-8"))
+        error_file = None
+        if error_lines:
+            error_file = self.create_file("batch_errors.jsonl", "batch_output",
+                                          "\n".join(error_lines).encode("utf-8"))
+        with self.lock:
+            batch.update({
+                "status": "completed",
+                "completed_at": int(time.time()),
+                "output_file_id": output_file["id"],
+                "error_file_id": error_file["id"] if error_file else None,
+                "request_counts": {
+                    "total": len(output_lines) + len(error_lines),
+                    "completed": len(output_lines),
+                    "failed": len(error_lines)
+                }
+            })
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Định tuyến request tới các endpoint giả lập."""
+
+    protocol_version = "HTTP/1.1"
+
+    routes = [
+        ("POST", r"/v1/files", "create_file"),
+        ("GET", r"/v1/files/(?P<file_id>[\w-]+)/content", "file_content"),
+        ("GET", r"/v1/files/(?P<file_id>[\w-]+)", "retrieve_file"),
+        ("POST", r"/v1/batches", "create_batch"),
+        ("GET", r"/v1/batches/(?P<batch_id>[\w-]+)", "retrieve_batch"),
+        ("POST", r"/v1/chat/completions", "chat_completions"),
+        ("POST", r"/v1/threads", "create_thread"),
+        ("GET", r"/v1/threads/(?P<thread_id>[\w-]+)", "retrieve_thread"),
+        ("DELETE", r"/v1/threads/(?P<thread_id>[\w-]+)", "delete_thread"),
+        ("POST", r"/v1/threads/(?P<thread_id>[\w-]+)/messages", "create_message"),
+        ("GET", r"/v1/threads/(?P<thread_id>[\w-]+)/messages", "list_messages"),
+        ("POST", r"/v1/threads/(?P<thread_id>[\w-]+)/runs", "create_run"),
+        ("GET", r"/v1/threads/(?P<thread_id>[\w-]+)/runs/(?P<run_id>[\w-]+)", "retrieve_run"),
+        ("GET", r"/v1/fine_tuning/jobs", "list_finetune_jobs"),
+        ("GET", r"/v1/fine_tuning/jobs/(?P<job_id>[\w-]+)", "retrieve_finetune_job"),
+        ("GET", r"/v1/fine_tuning/jobs/(?P<job_id>[\w-]+)/events", "list_finetune_events"),
+    ]
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        # Tắt log mặc định của http.server
+        pass
+
+    def _dispatch(self, method):
+        path = self.path.split("?", 1)[0]
+        for route_method, pattern, handler_name in self.routes:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, path)
+            if match:
+                return getattr(self, handler_name)(**match.groupdict())
+        self._send_error(404, f"Unknown endpoint: {method} {path}")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _query(self):
+        if "?" not in self.path:
+            return {}
+        return {key: values[-1] for key, values in parse_qs(self.path.split("?", 1)[1]).items()}
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self):
+        body = self._read_body()
+        return json.loads(body) if body else {}
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json({"error": {"message": message, "type": "mock_error", "code": None}},
+                        status=status, headers=headers)
+
+    def _inject_error(self):
+        """Trả lỗi giả lập theo error_rate; trả về True nếu đã trả lỗi."""
+        if not self.state.should_fail():
+            return False
+        self.state.count_request("injected_errors")
+        headers = {}
+        if self.state.retry_after is not None:
+            headers["retry-after"] = str(self.state.retry_after)
+        self._send_error(self.state.error_status, "Injected error", headers=headers)
+        return True
+
+    def _start_stream(self):
+        # Không biết trước độ dài: gửi Connection: close và đóng kết nối khi xong
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_event(self, data, event=None):
+        payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+        frame = f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+        self.wfile.write(frame.encode("utf-8"))
+        self.wfile.flush()
+
+    def _chunks(self, text):
+        size = self.state.stream_chunk_size
+        for start in range(0, len(text), size):
+            if self.state.stream_chunk_delay:
+                time.sleep(self.state.stream_chunk_delay)
+            yield text[start:start + size]
+
+    def chat_completions(self):
+        self.state.count_request("chat_completions")
+        body = self._read_json()
+        if self._inject_error():
+            return
+        time.sleep(self.state.latency.sample())
+        completion = chat_completion_body(body, cached_tokens=self.state.cached_tokens(body.get("messages")))
+        if not body.get("stream"):
+            return self._send_json(completion)
+
+        self._start_stream()
+        base = {"id": completion["id"], "object": "chat.completion.chunk",
+                "created": completion["created"], "model": completion["model"]}
+        content = completion["choices"][0]["message"]["content"]
+        self._send_event({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""},
+                                               "finish_reason": None}]})
+        for chunk in self._chunks(content):
+            self._send_event({**base, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+        self._send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._send_event("[DONE]")
+
+    def create_thread(self):
+        self.state.count_request("threads.create")
+        body = self._read_json()
+        if self._inject_error():
+            return
+        self._send_json(self.state.create_thread(body.get("metadata")))
+
+    def retrieve_thread(self, thread_id):
+        thread = self.state.threads.get(thread_id)
+        if thread is None:
+            return self._send_error(404, f"No thread found with id '{thread_id}'.")
+        self._send_json(thread)
+
+    def delete_thread(self, thread_id):
+        self._send_json(self.state.delete_thread(thread_id))
+
+    def create_message(self, thread_id):
+        self.state.count_request("messages.create")
+        body = self._read_json()
+        if thread_id not in self.state.threads:
+            return self._send_error(404, f"No thread found with id '{thread_id}'.")
+        if self._inject_error():
+            return
+        if self.state.active_run(thread_id):
+            return self._send_error(400, f"Can't add messages to {thread_id} while a run is active.")
+        content = body.get("content")
+        if not isinstance(content, str):
+            content = " ".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+        self._send_json(self.state.create_message(thread_id, body.get("role", "user"), content))
+
+    def _send_page(self, items):
+        """Phân trang kiểu cursor (after=id, limit) giống các endpoint list của API."""
+        query = self._query()
+        if query.get("after"):
+            ids = [item["id"] for item in items]
+            if query["after"] in ids:
+                items = items[ids.index(query["after"]) + 1:]
+        limit = int(query.get("limit", 20))
+        page = items[:limit]
+        self._send_json({
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(items) > limit
+        })
+
+    def list_messages(self, thread_id):
+        self.state.count_request("messages.list")
+        if thread_id not in self.state.threads:
+            return self._send_error(404, f"No thread found with id '{thread_id}'.")
+        query = self._query()
+        with self.state.lock:
+            messages = list(self.state.messages[thread_id])
+        if query.get("run_id"):
+            messages = [m for m in messages if m["run_id"] == query["run_id"]]
+        if query.get("order", "desc") == "desc":
+            messages.reverse()
+        self._send_page(messages)
+
+    def create_run(self, thread_id):
+        self.state.count_request("runs.create")
+        body = self._read_json()
+        if thread_id not in self.state.threads:
+            return self._send_error(404, f"No thread found with id '{thread_id}'.")
+        if self._inject_error():
+            return
+        run = self.state.create_run(thread_id, body.get("assistant_id"))
+        if run is None:
+            return self._send_error(400, f"Thread {thread_id} already has an active run.")
+        if not body.get("stream"):
+            self.state.complete_run_later(run["id"])
+            return self._send_json(run)
+
+        self._start_stream()
+        self._send_event(run, event="thread.run.created")
+        self._send_event(run, event="thread.run.queued")
+        run = self.state.update_run(run["id"], status="in_progress", started_at=int(time.time()))
+        self._send_event(run, event="thread.run.in_progress")
+
+        # Như API thật: một bước gọi tool (file_search) rồi bước tạo tin nhắn, mỗi bước có sự kiện riêng
+        tool_call = {"id": _new_id("call"), "type": "file_search", "file_search": {}}
+        step = self._run_step(run, "tool_calls", {"type": "tool_calls", "tool_calls": []})
+        self._send_event(step, event="thread.run.step.created")
+        self._send_event(step, event="thread.run.step.in_progress")
+        self._send_event({
+            "id": step["id"],
+            "object": "thread.run.step.delta",
+            "delta": {"step_details": {"type": "tool_calls", "tool_calls": [{"index": 0, **tool_call}]}}
+        }, event="thread.run.step.delta")
+        time.sleep(self.state.latency.sample())
+        step.update(status="completed", completed_at=int(time.time()),
+                    step_details={"type": "tool_calls", "tool_calls": [tool_call]})
+        self._send_event(step, event="thread.run.step.completed")
+
+        reply = self.state.run_reply(thread_id)
+        message = self.state.create_message(thread_id, "assistant", reply, run_id=run["id"],
+                                            assistant_id=run["assistant_id"])
+        step = self._run_step(run, "message_creation",
+                              {"type": "message_creation", "message_creation": {"message_id": message["id"]}})
+        self._send_event(step, event="thread.run.step.created")
+        self._send_event(step, event="thread.run.step.in_progress")
+        self._send_event({**message, "status": "in_progress", "content": []}, event="thread.message.created")
+        for chunk in self._chunks(reply):
+            self._send_event({
+                "id": message["id"],
+                "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": chunk, "annotations": []}}]}
+            }, event="thread.message.delta")
+        self._send_event(message, event="thread.message.completed")
+        step.update(status="completed", completed_at=int(time.time()))
+        self._send_event(step, event="thread.run.step.completed")
+        run = self.state.update_run(run["id"], status="completed", completed_at=int(time.time()))
+        self._send_event(run, event="thread.run.completed")
+        self._send_event("[DONE]", event="done")
+
+    def _run_step(self, run, step_type, step_details):
+        return {
+            "id": _new_id("step"),
+            "object": "thread.run.step",
+            "created_at": int(time.time()),
+            "run_id": run["id"],
+            "assistant_id": run["assistant_id"],
+            "thread_id": run["thread_id"],
+            "type": step_type,
+            "status": "in_progress",
+            "step_details": step_details,
+            "last_error": None,
+            "expired_at": None,
+            "cancelled_at": None,
+            "failed_at": None,
+            "completed_at": None,
+            "usage": None
+        }
+
+    def retrieve_run(self, thread_id, run_id):
+        self.state.count_request("runs.retrieve")
+        with self.state.lock:
+            run = self.state.runs.get(run_id)
+            run = dict(run) if run else None
+        if run is None or run["thread_id"] != thread_id:
+            return self._send_error(404, f"No run found with id '{run_id}'.")
+        self._send_json(run)
+
+    def list_finetune_jobs(self):
+        self.state.count_request("fine_tuning.jobs.list")
+        if self._inject_error():
+            return
+        self._send_page(self.state.list_finetune_jobs())
+
+    def retrieve_finetune_job(self, job_id):
+        self.state.count_request("fine_tuning.jobs.retrieve")
+        if self._inject_error():
+            return
+        job = self.state.finetune_job(job_id)
+        if job is None:
+            return self._send_error(404, f"No fine-tuning job found with id '{job_id}'.")
+        self._send_json(job)
+
+    def list_finetune_events(self, job_id):
+        self.state.count_request("fine_tuning.jobs.list_events")
+        if self._inject_error():
+            return
+        events = self.state.list_finetune_events(job_id)
+        if events is None:
+            return self._send_error(404, f"No fine-tuning job found with id '{job_id}'.")
+        self._send_page(events)
+
+    def create_file(self):
+        # Tách multipart/form-data bằng email parser thay cho module cgi đã bị loại bỏ
+        raw = (f"Content-Type: {self.headers['Content-Type']}\r\n\r\n").encode() + self._read_body()
+        message = email.message_from_bytes(raw, policy=email.policy.HTTP)
+        fields = {}
+        filename = "upload.jsonl"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                filename = part.get_filename()
+            fields[name] = part.get_payload(decode=True)
+        content = fields.get("file") or b""
+        purpose = (fields.get("purpose") or b"batch").decode()
+        self._send_json(self.state.create_file(filename, purpose, content))
+
+    def retrieve_file(self, file_id):
+        file_object = self.state.files.get(file_id)
+        if file_object is None:
+            return self._send_error(404, f"No such file: {file_id}")
+        self._send_json(file_object)
+
+    def file_content(self, file_id):
+        content = self.state.file_contents.get(file_id)
+        if content is None:
+            return self._send_error(404, f"No such file: {file_id}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def create_batch(self):
+        body = self._read_json()
+        if body.get("input_file_id") not in self.state.files:
+            return self._send_error(400, "input_file_id not found")
+        self._send_json(self.state.create_batch(
+            body["input_file_id"], body.get("endpoint"), body.get("completion_window"), body.get("metadata")
+        ))
+
+    def retrieve_batch(self, batch_id):
+        batch = self.state.batches.get(batch_id)
+        if batch is None:
+            return self._send_error(404, f"No such batch: {batch_id}")
+        with self.state.lock:
+            self._send_json(dict(batch))
+
+
+class MockOpenAIServer:
+    """Chạy máy chủ giả lập ở thread nền, dùng được như context manager."""
+
+    def __init__(self, host="127.0.0.1", port=0, **state_options):
+        self.httpd = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = MockOpenAIState(**state_options)
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def add_latency_arguments(parser):
+    """Thêm các tham số cấu hình độ trễ/lỗi giả lập vào argparse (dùng chung với load_test.py)."""
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'lognormal'], default='fixed',
+                        help='Latency distribution (default: fixed)')
+    parser.add_argument('--latency-mean', type=float, default=0.0, help='Mean latency in seconds')
+    parser.add_argument('--latency-spread', type=float, default=0.0,
+                        help='Uniform half-width or lognormal sigma')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=429, help='HTTP status of injected errors')
+    parser.add_argument('--retry-after', type=float, help='Retry-After header sent with injected errors')
+    parser.add_argument('--stream-chunk-delay', type=float, default=0.0,
+                        help='Delay between streamed chunks in seconds')
+
+
+def latency_options(args):
+    return {
+        "latency": LatencyModel(args.latency, args.latency_mean, args.latency_spread),
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "retry_after": args.retry_after,
+        "stream_chunk_delay": args.stream_chunk_delay,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock OpenAI API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--batch-delay', type=float, default=0.5,
+                        help='Seconds a batch takes to complete (default: 0.5)')
+    parser.add_argument('--finetune-jobs', type=int, default=0,
+                        help='Finished fine-tuning jobs to seed (default: 0)')
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, batch_delay=args.batch_delay,
+                              finetune_jobs=args.finetune_jobs, **latency_options(args))
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import json
 import os
 import sqlite3
+import time
 from datetime import datetime
+
+import openai
 from openai import OpenAI
 
+from history_index import HistoryIndex
+from json_stream import AssistantReply, IncrementalJSONExtractor
+from resilience import ResilientCaller
+from retention import HistoryArchiver, RetentionPolicy
+from thread_registry import ThreadRegistry
+
 OPENAI_CONFIG = {
     'API_KEY': os.getenv("OPENAI_API_KEY"),
     'BASE_URL': "https://api.openai.com/v1",
@@ -11,19 +20,65 @@ OPENAI_CONFIG = {
     # 'MODEL': "gpt-4o-mini-2024-07-18",
     
     'COUNT_LIMIT': 100,
-    'ASSISTANT_ID': 'asst_YpC99r5sp9We0UpEmZhngiHx'
+    # Lưu trữ lịch sử cũ hơn số ngày này / giữ tối đa số dòng mới nhất này
+    'RETENTION_MAX_AGE_DAYS': 90,
+    'RETENTION_MAX_ROWS': 100000,
+    'ASSISTANT_ID': 'asst_YpC99r5sp9We0UpEmZhngiHx',
     # 'SYSTEM_PROMPT': SYSTEM_PROMPT["1"]
+    
+    # Thời hạn tối đa (giây) cho một lời gọi API, kể cả retry
+    'REQUEST_DEADLINE': 120,
+    'MAX_ATTEMPTS': 4,
+    
+    # 'stream': nhận sự kiện run và text delta ngay khi có; 'poll': poll với khoảng thời gian tăng dần
+    'RUN_MODE': 'stream',
+    'POLL_INITIAL_INTERVAL': 0.1,
+    'POLL_MAX_INTERVAL': 1.0,
+    
+    # Session mặc định khi chat từ dòng lệnh; thread của session được dùng lại giữa các lần chạy
+    'SESSION_ID': os.getenv("USER", "default"),
+    # Thread không dùng quá số ngày này sẽ được thay mới; số thread tạo sẵn cho session mới
+    'THREAD_TTL_DAYS': 30,
+    'THREAD_POOL_SIZE': 2
 }
 
+TERMINAL_RUN_STATUSES = {'completed', 'failed', 'cancelled', 'expired', 'incomplete', 'requires_action'}
+TERMINAL_RUN_EVENTS = {f'thread.run.{status}' for status in TERMINAL_RUN_STATUSES}
+
 class AssistantV2:
     def __init__(self, client, config):
         self.client = client
         self.assistant_id = config['ASSISTANT_ID']
+        # Không hedge: gửi tin nhắn/tạo run hai lần sẽ tạo dữ liệu trùng trên thread
+        self.caller = ResilientCaller(
+            'assistant',
+            deadline=config.get('REQUEST_DEADLINE', 120),
+            max_attempts=config.get('MAX_ATTEMPTS', 4)
+        )
+        self.run_mode = config.get('RUN_MODE', 'stream')
+        self.poll_initial_interval = config.get('POLL_INITIAL_INTERVAL', 0.1)
+        self.poll_max_interval = config.get('POLL_MAX_INTERVAL', 1.0)
+        # Thời gian (giây) của từng giai đoạn trong lượt gần nhất (của bất kỳ session nào)
+        self.last_timings = {}
         self.database_path = 'conversation_history_v2.db'
         self._initialize_database()
+        self.history_index = HistoryIndex(self.database_path)
+        self.archiver = HistoryArchiver(self.database_path)
+        self.retention_policy = RetentionPolicy(
+            max_age_days=config.get('RETENTION_MAX_AGE_DAYS'),
+            max_rows=config.get('RETENTION_MAX_ROWS')
+        )
+        self.session_id = config.get('SESSION_ID', 'default')
+        self.thread_registry = ThreadRegistry(
+            client,
+            self.database_path,
+            caller=self.caller,
+            ttl_days=config.get('THREAD_TTL_DAYS', 30),
+            pool_size=config.get('THREAD_POOL_SIZE', 2)
+        )
         
-        # Tạo thread mới
-        self.thread = None
+        # Thread của session hiện tại (lấy từ registry khi bắt đầu chat)
+        self.thread_id = None
 
     def _initialize_database(self):
         """Tạo cơ sở dữ liệu và bảng nếu chưa tồn tại."""
@@ -48,6 +103,8 @@ class AssistantV2:
             INSERT INTO conversation_history (user_message, assistant_response)
             VALUES (?, ?)
         ''', (user_message, assistant_response))
+        # Ghi module/từ khoá trong cùng transaction để phục vụ tìm kiếm và thống kê
+        self.history_index.index_response(cursor, cursor.lastrowid, assistant_response)
         conn.commit()
         conn.close()
 
@@ -65,76 +122,233 @@ class AssistantV2:
 
     def delete_all_history(self):
         """Xóa toàn bộ lịch sử hội thoại từ cơ sở dữ liệu."""
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM conversation_history')
-        conn.commit()
-        conn.close()
+        # Xoá theo từng chunk để không khoá database lâu và thu hồi dung lượng file
+        self.archiver.purge_all()
+        # Thread trên server vẫn còn nội dung hội thoại cũ: bỏ đi, lần chat sau sẽ cấp thread mới
+        self.thread_registry.forget(self.session_id)
+        self.thread_id = None
         print("Đã xóa toàn bộ lịch sử hội thoại.")
 
-    def generate_response(self, user_message):
-        """Tạo phản hồi dựa trên tin nhắn người dùng."""
+    def archive_old_history(self):
+        """Lưu trữ lịch sử cũ theo chính sách retention và thu gọn database."""
+        stats = self.archiver.archive(self.retention_policy)
+        if stats["archived"]:
+            print(f"Đã lưu trữ {stats['archived']} dòng vào {stats['archive_path']}.")
+        else:
+            print("Không có lịch sử nào cần lưu trữ.")
+        return stats
+
+    def generate_response(self, user_message, session_id=None, on_field=None):
+        """
+        Tạo phản hồi dựa trên tin nhắn người dùng, trả về AssistantReply (None nếu lỗi).
+
+        session_id mặc định là session của vòng chat hiện tại; truyền session khác để một
+        AssistantV2 phục vụ nhiều người dùng (xem AssistantDispatcher). Không gọi song song
+        cho cùng một session vì API không cho chạy nhiều run trên một thread.
+
+        on_field(key, value) được gọi ngay khi mỗi trường JSON cấp một hoàn tất trong lúc
+        stream, để có thể định tuyến theo 'type'/'module'/'action' trước khi 'response' xong.
+        """
         try:
+            session_id = session_id or self.session_id
+            if session_id == self.session_id and self.thread_id:
+                thread_id = self.thread_id
+            else:
+                thread_id = self.thread_registry.get_thread_id(session_id)
+
             # conversation_history = self.fetch_history()
             # for conv in conversation_history:
             #     # Gửi tin nhắn vào thread
             #     self.client.beta.threads.messages.create(
-            #         thread_id=self.thread.id,
+            #         thread_id=self.thread_id,
             #         role="user",
             #         content=conv['message']
             #     )
 
             #     # Gửi tin nhắn vào thread
             #     self.client.beta.threads.messages.create(
-            #         thread_id=self.thread.id,
+            #         thread_id=self.thread_id,
             #         role="assistant",
             #         content=conv['response']
             #     )
 
             # Gửi tin nhắn vào thread
-            self.client.beta.threads.messages.create(
-                thread_id=self.thread.id,
-                role="user",
-                content=user_message
-            )
+            timings = {}
+            started = time.perf_counter()
+            extractor = IncrementalJSONExtractor()
+
+            def on_text(text):
+                for key, value in extractor.feed(text):
+                    if 'first_field' not in timings:
+                        timings['first_field'] = time.perf_counter() - started
+                    if on_field:
+                        on_field(key, value)
+
+            try:
+                self.caller.call(
+                    self.client.beta.threads.messages.create,
+                    thread_id=thread_id,
+                    role="user",
+                    content=user_message,
+                    idempotent=False
+                )
+            except openai.NotFoundError:
+                # Thread đã lưu không còn trên server (hết hạn/bị xoá): cấp thread mới rồi gửi lại
+                thread_id = self.thread_registry.invalidate(session_id)
+                if session_id == self.session_id:
+                    self.thread_id = thread_id
+                self.caller.call(
+                    self.client.beta.threads.messages.create,
+                    thread_id=thread_id,
+                    role="user",
+                    content=user_message,
+                    idempotent=False
+                )
+            timings['message_create'] = time.perf_counter() - started
 
             # Thực thi thread và chờ kết quả
-            run = self.client.beta.threads.runs.create_and_poll(
-                thread_id=self.thread.id,
-                assistant_id=self.assistant_id
-            )
+            if self.run_mode == 'stream':
+                run_status, assistant_message_raw = self._run_streaming(thread_id, timings, on_text)
+            else:
+                run_status, assistant_message_raw = self._run_polling(thread_id, timings)
+            timings['total'] = time.perf_counter() - started
+            self.last_timings = timings
+
+            if run_status == 'completed':
+                self.thread_registry.touch(thread_id)
 
-            if run.status == 'completed':
-                # Lấy danh sách tin nhắn từ thread
-                messages = self.client.beta.threads.messages.list(thread_id=self.thread.id)
-                
-                assistant_message_raw = messages.data[0].content[0].text.value
-                # Xử lý nội dung trả về
-                cleaned_string = assistant_message_raw.strip("```json").strip("```").strip()
-                assistant_message = json.loads(cleaned_string)
+                # Xử lý nội dung trả về: phần chưa nhận qua delta (chế độ poll, stream bị ngắt)
+                if not extractor.done:
+                    if not assistant_message_raw.startswith(extractor.buffer):
+                        extractor = IncrementalJSONExtractor()
+                    on_text(assistant_message_raw[len(extractor.buffer):])
+                assistant_message = AssistantReply.from_dict(extractor.result())
 
                 # Lưu lịch sử hội thoại
-                self.save_to_database(user_message, json.dumps(assistant_message, ensure_ascii=False))
+                self.save_to_database(user_message, json.dumps(assistant_message.to_dict(), ensure_ascii=False))
 
                 return assistant_message
             else:
-                print(f"Run status: {run.status}")
+                print(f"Run status: {run_status}")
                 return None
         except Exception as e:
             print(f"Error generating response: {str(e)}")
             return None
 
-    def start_chat(self):
-        self.thread = self.client.beta.threads.create()
-        """Bắt đầu vòng lặp hội thoại."""
+    def _run_streaming(self, thread_id, timings, on_text=None):
+        """Chạy run ở chế độ stream, ghép text delta (và chuyển cho on_text) khi nhận được. Trả về (status, text)."""
+        started = time.perf_counter()
+        run_id = None
+        parts = []
+        result = None
+        callback_error = None
+        try:
+            stream = self.caller.call(
+                self.client.beta.threads.runs.create,
+                thread_id=thread_id,
+                assistant_id=self.assistant_id,
+                stream=True,
+                idempotent=False
+            )
+            timings['run_create'] = time.perf_counter() - started
+            with stream:
+                for event in stream:
+                    if event.event == 'thread.run.created':
+                        run_id = event.data.id
+                    elif event.event == 'thread.message.delta':
+                        if 'first_token' not in timings:
+                            timings['first_token'] = time.perf_counter() - started
+                        for block in event.data.delta.content or []:
+                            if block.type == 'text' and block.text and block.text.value:
+                                parts.append(block.text.value)
+                                if on_text and callback_error is None:
+                                    try:
+                                        on_text(block.text.value)
+                                    except Exception as e:
+                                        # Lỗi của callback không phải lỗi stream: đọc tiếp tới khi run kết thúc
+                                        callback_error = e
+                    elif event.event == 'thread.message.completed':
+                        # Nội dung đầy đủ đã có trong sự kiện, không cần gọi messages.list
+                        parts = [block.text.value for block in event.data.content if block.type == 'text']
+                    elif event.event in TERMINAL_RUN_EVENTS:
+                        # Chỉ sự kiện của run; thread.run.step.* cũng có status 'completed'
+                        timings['run'] = time.perf_counter() - started
+                        result = event.data.status, "".join(parts)
+                        break
+        except Exception as e:
+            if run_id is None:
+                raise
+            # Stream bị ngắt giữa chừng: run vẫn chạy trên server, chuyển sang poll run đó
+            print(f"Stream interrupted ({str(e)}), falling back to polling")
+
+        if result is None and run_id is not None:
+            # Stream bị ngắt hoặc kết thúc mà không có sự kiện kết thúc run
+            result = self._wait_and_fetch(thread_id, run_id, timings, started)
+        if callback_error is not None:
+            raise callback_error
+        return result or (None, "")
+
+    def _run_polling(self, thread_id, timings):
+        """Tạo run rồi poll với khoảng thời gian tăng dần. Trả về (status, text)."""
+        started = time.perf_counter()
+        run = self.caller.call(
+            self.client.beta.threads.runs.create,
+            thread_id=thread_id,
+            assistant_id=self.assistant_id,
+            idempotent=False
+        )
+        timings['run_create'] = time.perf_counter() - started
+        return self._wait_and_fetch(thread_id, run.id, timings, started, status=run.status)
+
+    def _wait_and_fetch(self, thread_id, run_id, timings, started, status=None):
+        """Poll run tới khi kết thúc (bắt đầu nhanh, giãn dần tới POLL_MAX_INTERVAL) rồi lấy tin nhắn của run."""
+        interval = self.poll_initial_interval
+        while status not in TERMINAL_RUN_STATUSES:
+            time.sleep(interval)
+            interval = min(interval * 1.5, self.poll_max_interval)
+            run = self.caller.call(
+                self.client.beta.threads.runs.retrieve,
+                run_id,
+                thread_id=thread_id
+            )
+            status = run.status
+        timings['run'] = time.perf_counter() - started
+        if status != 'completed':
+            return status, ""
+
+        # Chỉ lấy tin nhắn mới nhất của run này thay vì toàn bộ thread
+        fetch_started = time.perf_counter()
+        messages = self.caller.call(
+            self.client.beta.threads.messages.list,
+            thread_id=thread_id,
+            order="desc",
+            limit=1,
+            run_id=run_id
+        )
+        timings['message_fetch'] = time.perf_counter() - fetch_started
+        return status, messages.data[0].content[0].text.value
+
+    def _print_route_field(self, key, value):
+        """In các trường định tuyến ngay khi nhận được (trước khi 'response' sinh xong)."""
+        if key in ('type', 'module', 'action'):
+            print(f"  [{key}] {value}")
+
+    def start_chat(self, session_id=None):
+        """Bắt đầu vòng lặp hội thoại, tiếp tục thread đã lưu của session nếu còn hạn."""
+        if session_id:
+            self.session_id = session_id
+        self.thread_id = self.thread_registry.get_thread_id(self.session_id)
+        self.thread_registry.refill_pool_async()
         while True:
             user_message = input("User: ")
             if user_message.lower() == "exit":
                 break
             start_time = datetime.now()
-            response = self.generate_response(user_message)
+            response = self.generate_response(user_message, on_field=self._print_route_field)
             end_time = datetime.now()
             print(f"Time elapsed: {end_time - start_time}")
+            if self.last_timings:
+                print("Timings: " + ", ".join(f"{name}={value:.3f}s" for name, value in self.last_timings.items()))
             print(f"Assistant: {response}")
 
 if __name__ == "__main__":
@@ -146,7 +360,8 @@ if __name__ == "__main__":
     """
     
 
-    openai_client = OpenAI(api_key=OPENAI_CONFIG['API_KEY'], base_url=OPENAI_CONFIG['BASE_URL'])
+    # Retry do ResilientCaller đảm nhận nên tắt retry mặc định của client
+    openai_client = OpenAI(api_key=OPENAI_CONFIG['API_KEY'], base_url=OPENAI_CONFIG['BASE_URL'], max_retries=0)
 
     assistant = AssistantV2(client=openai_client, config=OPENAI_CONFIG)
 
@@ -155,9 +370,12 @@ if __name__ == "__main__":
     print("1. Bắt đầu chat với AssistantV2.")
     print("2. Xem lịch sử hội thoại.")
     print("3. Xóa toàn bộ lịch sử hội thoại.")
+    print("4. Tìm kiếm lịch sử hội thoại.")
+    print("5. Thống kê từ khoá và module.")
+    print("6. Lưu trữ và dọn dẹp lịch sử cũ.")
     print("0. Thoát.")
 
-    choice = input("Chọn chức năng (1/2/3/0): ")
+    choice = input("Chọn chức năng (1/2/3/4/5/6/0): ")
 
     if choice == "1":
         assistant.start_chat()
@@ -170,6 +388,23 @@ if __name__ == "__main__":
             print()
     elif choice == "3":
         assistant.delete_all_history()
+    elif choice == "4":
+        query = input("Từ khoá tìm kiếm: ")
+        for conv in assistant.history_index.search(query):
+            print(f"[{conv['timestamp']}] User: {conv['message']}")
+            print(f"Assistant: {conv['response']}")
+            print()
+    elif choice == "5":
+        start = input("Từ ngày (YYYY-MM-DD, bỏ trống = tất cả): ").strip() or None
+        end = input("Đến ngày (YYYY-MM-DD, bỏ trống = hiện tại): ").strip() or None
+        print("Module:")
+        for row in assistant.history_index.module_counts(start, end):
+            print(f"  {row['module']} ({row['type']}): {row['count']}")
+        print("Từ khoá:")
+        for row in assistant.history_index.keyword_counts(start, end):
+            print(f"  {row['keyword']}: {row['count']}")
+    elif choice == "6":
+        assistant.archive_old_history()
     elif choice == "0":
         print("Goodbye!")
     else:
@@ -1,10 +1,20 @@
 from openai import OpenAI
 import sqlite3
 from datetime import datetime
+from itertools import islice
 
 from dotenv import load_dotenv
 import os
 import pytz
+
+from context_builder import ContextBuilder
+from finetune_monitor import FineTuneMonitor
+from history_index import HistoryIndex
+from prompt_assembly import PromptAssembler
+from resilience import ResilientCaller
+from retention import HistoryArchiver, RetentionPolicy
+from vision_preprocess import VisionPreprocessor
+
 vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
 
 load_dotenv()
@@ -61,18 +71,65 @@ OPENAI_CONFIG = {
     
     
     'COUNT_LIMIT': 3,
+    # Lưu trữ lịch sử cũ hơn số ngày này / giữ tối đa số dòng mới nhất này
+    'RETENTION_MAX_AGE_DAYS': 90,
+    'RETENTION_MAX_ROWS': 100000,
+    # Ngân sách token cho system prompt + lịch sử + tin nhắn hiện tại
+    'CONTEXT_TOKEN_BUDGET': 3000,
+    # Gộp các lượt cũ vào bản tóm tắt khi phần bị cắt vượt quá số token này
+    'SUMMARY_TRIGGER_TOKENS': 800,
+    
+    'SYSTEM_PROMPT': SYSTEM_PROMPT["2"],
+    # Các phần tĩnh (mô tả module, tool, ...) được ghép ngay sau system prompt
+    'PROMPT_SECTIONS': [],
     
-    'SYSTEM_PROMPT': SYSTEM_PROMPT["2"]
+    # File đính kèm mặc định (ảnh hoặc PDF), được thu nhỏ và gửi dưới dạng base64
+    # PDF https://www.imws.vn/file/2a0229bb
+    # Image https://www.imws.vn/file/355667f0
+    'ATTACHMENTS': ["https://www.imws.vn/file/2a0229bb"],
+    'IMAGE_DETAIL': 'low',
+    
+    # Thời hạn tối đa (giây) cho một lời gọi API, kể cả retry
+    'REQUEST_DEADLINE': 60,
+    'MAX_ATTEMPTS': 4,
+    # Gửi request dự phòng khi request đầu chậm hơn p95
+    'HEDGE_REQUESTS': False
 }
 
 class ChatBot:
     def __init__(self, config):
-        self.client = OpenAI(api_key=config['API_KEY'], base_url=config['BASE_URL'])
+        # Retry do ResilientCaller đảm nhận nên tắt retry mặc định của client
+        self.client = OpenAI(api_key=config['API_KEY'], base_url=config['BASE_URL'], max_retries=0)
+        self.caller = ResilientCaller(
+            'chat_completions',
+            deadline=config.get('REQUEST_DEADLINE', 60),
+            max_attempts=config.get('MAX_ATTEMPTS', 4),
+            hedge=config.get('HEDGE_REQUESTS', False)
+        )
         self.system_prompt = config['SYSTEM_PROMPT']
         self.model = config['MODEL']
         self.count_limit = config['COUNT_LIMIT']
         self.database_path = 'conversation_history.db'
         self._initialize_database()
+        self.history_index = HistoryIndex(self.database_path)
+        self.archiver = HistoryArchiver(self.database_path)
+        self.finetune_monitor = FineTuneMonitor(self.client, self.database_path, caller=self.caller)
+        self.retention_policy = RetentionPolicy(
+            max_age_days=config.get('RETENTION_MAX_AGE_DAYS'),
+            max_rows=config.get('RETENTION_MAX_ROWS')
+        )
+        self.context_builder = ContextBuilder(
+            client=self.client,
+            model=self.model,
+            database_path=self.database_path,
+            token_budget=config.get('CONTEXT_TOKEN_BUDGET', 3000),
+            summary_trigger_tokens=config.get('SUMMARY_TRIGGER_TOKENS', 800),
+            caller=self.caller
+        )
+        self.prompt_assembler = PromptAssembler(self.system_prompt, config.get('PROMPT_SECTIONS'))
+        self.attachments = config.get('ATTACHMENTS', [])
+        self.vision_preprocessor = VisionPreprocessor(detail=config.get('IMAGE_DETAIL', 'low'))
+        self.last_usage = None
 
     def _initialize_database(self):
         """Tạo cơ sở dữ liệu và bảng nếu chưa tồn tại."""
@@ -97,6 +154,8 @@ class ChatBot:
             INSERT INTO conversation_history (user_message, assistant_response)
             VALUES (?, ?)
         ''', (user_message, assistant_response))
+        # Ghi module/từ khoá trong cùng transaction để phục vụ tìm kiếm và thống kê
+        self.history_index.index_response(cursor, cursor.lastrowid, assistant_response)
         conn.commit()
         conn.close()
 
@@ -115,38 +174,52 @@ class ChatBot:
         conn.close()
         return [{"message": row[0], "response": row[1]} for row in rows[::-1]]  # Đảo ngược thứ tự
 
-    def generate_response(self, user_message):
+    def _prepare_attachments(self, attachments):
+        """Chuyển các file đính kèm thành content part ảnh, bỏ qua file lỗi."""
+        parts = []
+        for source in attachments:
+            try:
+                parts.extend(self.vision_preprocessor.prepare(source))
+            except Exception as e:
+                print(f"Error preparing attachment {source}: {str(e)}")
+        return parts
+
+    def generate_response(self, user_message, attachments=None):
         """Tạo phản hồi dựa trên tin nhắn người dùng và lịch sử hội thoại."""
+        if attachments is None:
+            attachments = self.attachments
         try:
             time_now = datetime.now(vietnam_tz).strftime("%Y-%m-%d %H:%M:%S")
-            conversation_history = self.fetch_history()
-            messages = [{"role": "system", "content": f"{time_now}: {self.system_prompt}"}]
-            
-            # Thêm lịch sử hội thoại vào messages
-            for conv in conversation_history:
-                messages.append({"role": "user", "content": conv['message']})
-                messages.append({"role": "assistant", "content": conv['response']})
+            # Thời gian thay đổi mỗi giây nên đặt ở cuối prompt để prefix tĩnh được cache
+            volatile = {"Thời gian hiện tại": time_now}
             
             # Thêm tin nhắn hiện tại
-            # messages.append({"role": "user", "content": user_message})
-            
-            messages.append({"role": "user", "content": [
+            user_content = [
                 {
                     "type": "text",
                     "text": user_message
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url":  "https://www.imws.vn/file/2a0229bb"
-                    }
                 }
-            ]})
-            # PDF https://www.imws.vn/file/2a0229bb
-            # Image https://www.imws.vn/file/355667f0
+            ]
+            user_content.extend(self._prepare_attachments(attachments))
+            
+            # Chọn lịch sử theo ngân sách token thay vì số lượt cố định
+            estimator = self.context_builder.estimator
+            reserved_tokens = sum(estimator.count_message(message)
+                                  for message in self.prompt_assembler.prefix_messages())
+            reserved_tokens += estimator.count_message(self.prompt_assembler.volatile_message(volatile))
+            reserved_tokens += estimator.count_content(user_content)
+            summary, conversation_history = self.context_builder.build_history(reserved_tokens)
+            
+            messages = self.prompt_assembler.assemble(
+                user_content,
+                summary=summary,
+                turns=conversation_history,
+                volatile=volatile
+            )
             
             # Gọi API
-            response = self.client.chat.completions.create(
+            response = self.caller.call(
+                self.client.chat.completions.create,
                 model=self.model,
                 messages=messages,
                 temperature=0.7,
@@ -155,6 +228,7 @@ class ChatBot:
                 frequency_penalty=0,
                 presence_penalty=0
             )
+            self.last_usage = self.prompt_assembler.record_usage(response.usage)
             assistant_response = response.choices[0].message.content.strip()
             self.save_to_database(user_message, assistant_response)
             return assistant_response
@@ -164,16 +238,23 @@ class ChatBot:
 
     def delete_all_history(self):
         """Xóa tất cả lịch sử hội thoại từ cơ sở dữ liệu."""
-        conn = sqlite3.connect(self.database_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM conversation_history')
-        conn.commit()
-        conn.close()
+        # Xoá theo từng chunk để không khoá database lâu và thu hồi dung lượng file
+        self.archiver.purge_all()
+        self.context_builder.clear_summary()
         print("Đã xóa toàn bộ lịch sử hội thoại.")
         
-    def get_fine_tuning_jobs(self):
-        jobs = self.client.fine_tuning.jobs.list()
-        return jobs
+    def archive_old_history(self):
+        """Lưu trữ lịch sử cũ theo chính sách retention và thu gọn database."""
+        stats = self.archiver.archive(self.retention_policy)
+        if stats["archived"]:
+            print(f"Đã lưu trữ {stats['archived']} dòng vào {stats['archive_path']}.")
+        else:
+            print("Không có lịch sử nào cần lưu trữ.")
+        return stats
+
+    def get_fine_tuning_jobs(self, limit=20, refresh=False):
+        """Danh sách job mới nhất, lấy từ cache và chỉ gọi API cho các trang có thể đã thay đổi."""
+        return list(islice(self.finetune_monitor.iter_jobs(refresh=refresh), limit))
     
     def start_chat(self):
         """Bắt đầu vòng lặp hội thoại."""
@@ -185,6 +266,8 @@ class ChatBot:
             response = self.generate_response(user_message)
             end_time = datetime.now()
             print(f"Time elapsed: {end_time - start_time}")
+            if self.last_usage:
+                print(f"Prompt tokens: {self.last_usage['prompt_tokens']} (cached: {self.last_usage['cached_tokens']})")
             print(f"Bot: {response}")
 
 
@@ -202,9 +285,12 @@ if __name__ == "__main__":
     print("2. Xem lịch sử hội thoại.")
     print("3. Xóa toàn bộ lịch sử hội thoại.")
     print("4. Xem danh sách công việc fine-tuning.")
+    print("5. Tìm kiếm lịch sử hội thoại.")
+    print("6. Thống kê từ khoá và module.")
+    print("7. Lưu trữ và dọn dẹp lịch sử cũ.")
     print("0. Thoát.")
     
-    choice = input("Chọn chức năng (1/2/3): ")
+    choice = input("Chọn chức năng (1/2/3/4/5/6/7/0): ")
     
     if choice == "1":
         chatbot = ChatBot(OPENAI_CONFIG)
@@ -224,11 +310,37 @@ if __name__ == "__main__":
         chatbot = ChatBot(OPENAI_CONFIG)
         jobs = chatbot.get_fine_tuning_jobs()
         for job in jobs:
-            print(f"Job ID: {job.id}")
-            print(f"Status: {job.status}")
-            print(f"Model: {job.model}")
-            print(f"Created at: {job.created_at}")
+            print(f"Job ID: {job['id']}")
+            print(f"Status: {job['status']}")
+            print(f"Model: {job['model']}")
+            print(f"Created at: {job['created_at']}")
             print()
+        job_id = input("Theo dõi job (nhập Job ID, bỏ trống = bỏ qua): ").strip()
+        if job_id:
+            job = chatbot.finetune_monitor.follow(
+                job_id, on_event=lambda event: print(f"[{event['level']}] {event['message']}")
+            )
+            print(f"Status: {job['status']}")
+    elif choice == "5":
+        chatbot = ChatBot(OPENAI_CONFIG)
+        query = input("Từ khoá tìm kiếm: ")
+        for conv in chatbot.history_index.search(query):
+            print(f"[{conv['timestamp']}] User: {conv['message']}")
+            print(f"Assistant: {conv['response']}")
+            print()
+    elif choice == "6":
+        chatbot = ChatBot(OPENAI_CONFIG)
+        start = input("Từ ngày (YYYY-MM-DD, bỏ trống = tất cả): ").strip() or None
+        end = input("Đến ngày (YYYY-MM-DD, bỏ trống = hiện tại): ").strip() or None
+        print("Module:")
+        for row in chatbot.history_index.module_counts(start, end):
+            print(f"  {row['module']} ({row['type']}): {row['count']}")
+        print("Từ khoá:")
+        for row in chatbot.history_index.keyword_counts(start, end):
+            print(f"  {row['keyword']}: {row['count']}")
+    elif choice == "7":
+        chatbot = ChatBot(OPENAI_CONFIG)
+        chatbot.archive_old_history()
     elif choice == "0" or choice == "exit":
         print("Goodbye!")
     else:
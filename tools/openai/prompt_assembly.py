@@ -0,0 +1,63 @@
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PromptAssembler:
+    """
+    Ghép messages theo thứ tự ổn định để tận dụng prompt caching của provider.
+
+    Phần tĩnh (system prompt, mô tả module/tool) luôn đứng đầu và giữ nguyên từng byte;
+    dữ liệu thay đổi theo từng lượt (thời gian hiện tại, ...) được đặt ở cuối, ngay trước
+    tin nhắn của người dùng.
+    """
+
+    def __init__(self, system_prompt, static_sections=None):
+        # Chuẩn hoá một lần để prefix không phụ thuộc vào cách nối chuỗi mỗi lượt
+        parts = [system_prompt.strip()] + [section.strip() for section in static_sections or []]
+        self.static_prefix = "\n\n".join(part for part in parts if part)
+        self.prefix_fingerprint = hashlib.sha256(self.static_prefix.encode("utf-8")).hexdigest()[:12]
+        self.usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def prefix_messages(self):
+        """Các message tĩnh luôn nằm ở đầu prompt."""
+        return [{"role": "system", "content": self.static_prefix}]
+
+    def volatile_message(self, volatile):
+        """Message chứa dữ liệu thay đổi theo từng lượt, đặt ở cuối prompt."""
+        lines = [f"{key}: {value}" for key, value in volatile.items()]
+        return {"role": "system", "content": "\n".join(lines)}
+
+    def assemble(self, user_content, summary="", turns=None, volatile=None):
+        """Ghép prompt: phần tĩnh -> tóm tắt -> lịch sử -> dữ liệu thay đổi -> tin nhắn hiện tại."""
+        messages = self.prefix_messages()
+        if summary:
+            # Bản tóm tắt chỉ đổi khi được làm mới, nên đặt ngay sau phần tĩnh
+            messages.append({"role": "system", "content": f"Tóm tắt hội thoại trước đó: {summary}"})
+
+        for conv in turns or []:
+            messages.append({"role": "user", "content": conv['message']})
+            messages.append({"role": "assistant", "content": conv['response']})
+
+        if volatile:
+            messages.append(self.volatile_message(volatile))
+        messages.append({"role": "user", "content": user_content})
+        return messages
+
+    def record_usage(self, usage):
+        """Ghi log số token prompt và số token được cache từ trường usage của API."""
+        if usage is None:
+            return None
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+        self.usage_totals["requests"] += 1
+        self.usage_totals["prompt_tokens"] += prompt_tokens
+        self.usage_totals["cached_tokens"] += cached_tokens
+
+        hit_rate = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        logger.info("prompt_tokens=%d cached_tokens=%d hit_rate=%.1f%% prefix=%s",
+                    prompt_tokens, cached_tokens, hit_rate * 100, self.prefix_fingerprint)
+        return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "hit_rate": hit_rate}
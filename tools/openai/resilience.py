@@ -0,0 +1,265 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Hết thời hạn của toàn bộ lời gọi (bao gồm các lần retry)."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Circuit breaker đang mở, lời gọi bị từ chối ngay để tránh dồn lỗi."""
+
+
+def is_retryable(error, idempotent=True):
+    """
+    Lỗi tạm thời (429, 5xx, timeout, mất kết nối) thì được retry.
+
+    Với lời gọi không idempotent (tạo message/run), chỉ retry 429: request bị từ chối trước
+    khi xử lý. Timeout, mất kết nối hay 5xx có thể xảy ra sau khi server đã thực hiện,
+    retry sẽ tạo bản ghi trùng.
+    """
+    status_code = getattr(error, 'status_code', None)
+    if not idempotent:
+        return status_code == 429
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, DeadlineExceeded))
+
+
+def retry_after_seconds(error):
+    """Đọc header Retry-After (hoặc retry-after-ms) từ response lỗi nếu có."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            # Dạng HTTP-date hiếm gặp với API này, bỏ qua
+            return None
+    return None
+
+
+class CallMetrics:
+    """Bộ đếm và mẫu độ trễ (thread-safe) cho một loại lời gọi."""
+
+    def __init__(self, sample_size=500):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.latencies = deque(maxlen=sample_size)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def sample_count(self):
+        with self.lock:
+            return len(self.latencies)
+
+    def percentile(self, percent):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            samples = len(self.latencies)
+        return {
+            **counters,
+            "samples": samples,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class CircuitBreaker:
+    """
+    Mở mạch sau failure_threshold lỗi liên tiếp; sau reset_timeout giây cho phép
+    một lời gọi thử (half-open), thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, metrics=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed" and self.metrics:
+                self.metrics.incr("circuit_closed")
+            self.state = "closed"
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open" and self.metrics:
+                    self.metrics.incr("circuit_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probe_in_flight = False
+
+
+class ResilientCaller:
+    """
+    Bọc lời gọi API với deadline, retry backoff có jitter (tôn trọng Retry-After),
+    hedged request tuỳ chọn và circuit breaker. Dùng chung cho ChatBot và AssistantV2.
+
+    Lời gọi được truyền thêm tham số timeout bằng thời gian còn lại của deadline,
+    nên client nên được tạo với max_retries=0 để không retry hai lớp.
+    """
+
+    def __init__(self, name, deadline=60, max_attempts=4, base_delay=0.5, max_delay=8,
+                 hedge=False, hedge_percentile=95, min_hedge_samples=20,
+                 failure_threshold=5, reset_timeout=30, max_workers=8):
+        self.name = name
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+        self.metrics = CallMetrics()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, metrics=self.metrics)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=f"{name}-hedge") if hedge else None
+
+    def call(self, fn, *args, deadline=None, hedge=None, idempotent=True, **kwargs):
+        """
+        Gọi fn(*args, timeout=..., **kwargs) với retry/hedging, trả về kết quả hoặc raise lỗi cuối cùng.
+
+        idempotent=False cho các lời gọi tạo dữ liệu (messages.create, runs.create): không hedge
+        và chỉ retry lỗi chắc chắn chưa được xử lý (xem is_retryable).
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        hedge = (self.hedge if hedge is None else hedge) and idempotent
+        self.metrics.incr("calls")
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                self.metrics.incr("circuit_rejected")
+                raise CircuitOpenError(f"{self.name}: circuit open")
+
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.metrics.incr("deadline_exceeded")
+                raise DeadlineExceeded(f"{self.name}: deadline exceeded")
+
+            try:
+                result = self._attempt(fn, args, kwargs, remaining, deadline_at, hedge)
+            except Exception as e:
+                retryable = is_retryable(e, idempotent)
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                else:
+                    # Lỗi phía request (4xx) nghĩa là dịch vụ vẫn phản hồi bình thường
+                    self.breaker.record_success()
+                if not retryable or attempt == self.max_attempts:
+                    self.metrics.incr("failures")
+                    raise
+
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    # Full jitter: ngẫu nhiên trong [0, base * 2^(attempt-1)]
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                else:
+                    self.metrics.incr("retry_after_honored")
+                if time.monotonic() + delay >= deadline_at:
+                    self.metrics.incr("deadline_exceeded")
+                    raise DeadlineExceeded(f"{self.name}: no time left to retry after {str(e)}") from e
+
+                self.metrics.incr("retries")
+                logger.warning("%s: attempt %d failed (%s), retrying in %.2fs", self.name, attempt, e, delay)
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.metrics.incr("successes")
+            return result
+
+    def _hedge_delay(self):
+        if self.metrics.sample_count() < self.min_hedge_samples:
+            return None
+        return self.metrics.percentile(self.hedge_percentile)
+
+    def _timed(self, fn, *args, **kwargs):
+        """Gọi fn một lần và ghi độ trễ của riêng lần gọi đó (không gồm retry/backoff)."""
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        self.metrics.observe(time.monotonic() - started)
+        return result
+
+    def _attempt(self, fn, args, kwargs, remaining, deadline_at, hedge):
+        hedge_delay = self._hedge_delay() if hedge and self._executor else None
+        if hedge_delay is None or hedge_delay >= remaining:
+            return self._timed(fn, *args, timeout=remaining, **kwargs)
+
+        # Gửi request dự phòng nếu request đầu chưa xong sau p95; lấy kết quả thành công đầu tiên
+        primary = self._executor.submit(self._timed, fn, *args, timeout=remaining, **kwargs)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        self.metrics.incr("hedges")
+        secondary = self._executor.submit(self._timed, fn, *args, timeout=max(0.1, deadline_at - time.monotonic()), **kwargs)
+        pending = {primary, secondary}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline_at - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"{self.name}: deadline exceeded while hedging")
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        self.metrics.incr("hedge_wins")
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
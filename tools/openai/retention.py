@@ -0,0 +1,246 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Giá trị PRAGMA auto_vacuum: 0 = NONE, 1 = FULL, 2 = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class RetentionPolicy:
+    """Chính sách lưu giữ: giữ các dòng mới hơn max_age_days và tối đa max_rows dòng mới nhất."""
+
+    def __init__(self, max_age_days=None, max_rows=None):
+        if max_age_days is None and max_rows is None:
+            raise ValueError("RetentionPolicy needs max_age_days and/or max_rows")
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+
+
+class HistoryArchiver:
+    """
+    Chuyển các dòng conversation_history cũ sang file lưu trữ nén (JSONL gzip/zstd)
+    theo từng chunk nhỏ, mỗi chunk một transaction ngắn, rồi thu hồi dung lượng
+    bằng incremental_vacuum để không khoá database lâu.
+    """
+
+    def __init__(self, database_path, archive_dir='archive', compression='auto',
+                 chunk_size=500, vacuum_pages=500, pause=0.05):
+        if compression == 'auto':
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        if compression not in ('gzip', 'zstd'):
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.database_path = database_path
+        self.archive_dir = archive_dir
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        # Nghỉ giữa các chunk để nhường khoá cho các lượt ghi của chatbot
+        self.pause = pause
+        self._initialize_database()
+
+    def _initialize_database(self):
+        """Thêm index theo thời gian (dùng cho chính sách theo tuổi và fetch_history)."""
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversation_history_timestamp
+            ON conversation_history (timestamp)
+        ''')
+        conn.commit()
+        conn.close()
+
+    def enable_incremental_vacuum(self):
+        """
+        Chuyển database sang auto_vacuum=INCREMENTAL (cần VACUUM toàn bộ một lần duy nhất).
+
+        archive() và purge_all() gọi hàm này sau khi đã xoá dòng, để lần VACUUM đầu chạy trên
+        database đã nhỏ đi thay vì giữ khoá lâu cho cả dữ liệu sắp bị xoá.
+        """
+        conn = sqlite3.connect(self.database_path)
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        conn.close()
+        return mode != AUTO_VACUUM_INCREMENTAL
+
+    def _cutoff_id(self, conn, policy):
+        """Id lớn nhất cần lưu trữ theo chính sách (0 nếu không có gì)."""
+        cutoff = 0
+        if policy.max_age_days is not None:
+            row = conn.execute('''
+                SELECT MAX(id) FROM conversation_history
+                WHERE timestamp < datetime('now', ?)
+            ''', (f'-{policy.max_age_days} days',)).fetchone()
+            cutoff = max(cutoff, row[0] or 0)
+        if policy.max_rows is not None:
+            row = conn.execute('''
+                SELECT id FROM conversation_history ORDER BY id DESC LIMIT 1 OFFSET ?
+            ''', (policy.max_rows,)).fetchone()
+            if row:
+                cutoff = max(cutoff, row[0])
+        return cutoff
+
+    def _open_archive(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(self.database_path))[0]
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        extension = '.jsonl.zst' if self.compression == 'zstd' else '.jsonl.gz'
+        # 'xb' không bao giờ ghi đè file lưu trữ cũ (các dòng của nó đã bị xoá khỏi database)
+        suffix = 0
+        while True:
+            path = os.path.join(self.archive_dir, f"{name}-{stamp}{f'-{suffix}' if suffix else ''}{extension}")
+            try:
+                raw = open(path, 'xb')
+                break
+            except FileExistsError:
+                suffix += 1
+        if self.compression == 'zstd':
+            return path, raw, zstandard.ZstdCompressor(level=10).stream_writer(raw)
+        return path, raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+
+    def _flush_archive(self, raw, writer):
+        """Đẩy dữ liệu nén xuống đĩa trước khi xoá các dòng tương ứng khỏi database."""
+        if self.compression == 'zstd':
+            writer.flush(zstandard.FLUSH_FRAME)
+        else:
+            writer.flush()
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    def archive(self, policy):
+        """Lưu trữ và xoá các dòng vượt chính sách. Trả về thống kê của lần chạy."""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cutoff = self._cutoff_id(conn, policy)
+        stats = {"archived": 0, "chunks": 0, "archive_path": None, "pages_freed": 0}
+        if cutoff == 0:
+            conn.close()
+            return stats
+
+        path, raw, writer = self._open_archive()
+        stats["archive_path"] = path
+        try:
+            last_id = 0
+            while True:
+                cursor = conn.cursor()
+                # BEGIN IMMEDIATE: giữ khoá ghi trong phạm vi một chunk
+                cursor.execute('BEGIN IMMEDIATE')
+                rows = cursor.execute('''
+                    SELECT id, user_message, assistant_response, timestamp FROM conversation_history
+                    WHERE id > ? AND id <= ?
+                    ORDER BY id LIMIT ?
+                ''', (last_id, cutoff, self.chunk_size)).fetchall()
+                if not rows:
+                    conn.rollback()
+                    break
+                for row_id, user_message, assistant_response, timestamp in rows:
+                    line = json.dumps({
+                        "id": row_id,
+                        "user_message": user_message,
+                        "assistant_response": assistant_response,
+                        "timestamp": timestamp
+                    }, ensure_ascii=False)
+                    writer.write((line + "\n").encode('utf-8'))
+                self._flush_archive(raw, writer)
+
+                last_id = rows[-1][0]
+                cursor.execute('DELETE FROM conversation_history WHERE id >= ? AND id <= ?',
+                               (rows[0][0], last_id))
+                conn.commit()
+                stats["archived"] += len(rows)
+                stats["chunks"] += 1
+                stats["pages_freed"] += self._incremental_vacuum(conn)
+                time.sleep(self.pause)
+        finally:
+            writer.close()
+            raw.close()
+            conn.close()
+        self.enable_incremental_vacuum()
+        return stats
+
+    def purge_all(self):
+        """Xoá toàn bộ lịch sử theo từng chunk (không lưu trữ) thay vì một câu DELETE lớn."""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        deleted = 0
+        try:
+            while True:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM conversation_history
+                    WHERE id IN (SELECT id FROM conversation_history ORDER BY id LIMIT ?)
+                ''', (self.chunk_size,))
+                conn.commit()
+                if cursor.rowcount <= 0:
+                    break
+                deleted += cursor.rowcount
+                self._incremental_vacuum(conn)
+                time.sleep(self.pause)
+        finally:
+            conn.close()
+        self.enable_incremental_vacuum()
+        return deleted
+
+    def _incremental_vacuum(self, conn):
+        """Trả lại tối đa vacuum_pages trang trống cho hệ điều hành."""
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # executescript chạy pragma tới khi xong; execute() chỉ step một lần nên chỉ giải phóng 1 trang
+        conn.executescript(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)});')
+        after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return before - after
+
+
+def iter_archive(path):
+    """Đọc lại một file lưu trữ (.jsonl.gz hoặc .jsonl.zst), trả về từng dòng dict."""
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("Reading .zst archives requires the 'zstandard' package")
+        with open(path, 'rb') as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            buffer = b''
+            while True:
+                chunk = reader.read(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if buffer.strip():
+                yield json.loads(buffer)
+        return
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive and prune conversation history')
+    parser.add_argument('-d', '--database', default='conversation_history.db', help='SQLite database path')
+    parser.add_argument('--max-age-days', type=int, help='Archive rows older than this many days')
+    parser.add_argument('--max-rows', type=int, help='Keep at most this many newest rows')
+    parser.add_argument('--archive-dir', default='archive', help='Directory for archive files')
+    parser.add_argument('--compression', choices=['auto', 'gzip', 'zstd'], default='auto')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Rows per transaction (default: 500)')
+    args = parser.parse_args()
+
+    archiver = HistoryArchiver(args.database, archive_dir=args.archive_dir,
+                               compression=args.compression, chunk_size=args.chunk_size)
+    stats = archiver.archive(RetentionPolicy(args.max_age_days, args.max_rows))
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
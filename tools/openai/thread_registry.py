@@ -0,0 +1,194 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadRegistry:
+    """
+    Lưu ánh xạ session (user/hội thoại) -> thread_id của Assistants API trong SQLite.
+
+    - Thread được dùng lại giữa các lần chạy, chỉ kiểm tra với server khi thật sự gửi tin nhắn
+      (lazy resume); thread không còn tồn tại thì gọi invalidate() để cấp thread mới.
+    - Thread không dùng quá ttl_days ngày thì hết hạn và được thay bằng thread mới.
+    - Một pool thread tạo sẵn (warm pool) giúp session mới không phải chờ threads.create.
+    """
+
+    def __init__(self, client, database_path, caller=None, ttl_days=30, pool_size=2):
+        self.client = client
+        self.database_path = database_path
+        self.caller = caller
+        self.ttl_days = ttl_days
+        self.pool_size = pool_size
+        self._refill_lock = threading.Lock()
+        self._initialize_database()
+
+    def _initialize_database(self):
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.executescript('''
+            CREATE TABLE IF NOT EXISTS assistant_threads (
+                session_id TEXT PRIMARY KEY,
+                thread_id TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_assistant_threads_thread_id
+                ON assistant_threads (thread_id);
+            CREATE INDEX IF NOT EXISTS idx_assistant_threads_last_used_at
+                ON assistant_threads (last_used_at);
+
+            CREATE TABLE IF NOT EXISTS assistant_thread_pool (
+                thread_id TEXT PRIMARY KEY,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _expiry_cutoff(self):
+        # Cùng định dạng với CURRENT_TIMESTAMP (UTC) để so sánh chuỗi được
+        return (datetime.utcnow() - timedelta(days=self.ttl_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _call(self, fn, *args, **kwargs):
+        if self.caller is not None:
+            return self.caller.call(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    def _create_remote_thread(self):
+        return self._call(self.client.beta.threads.create).id
+
+    def _delete_remote_thread(self, thread_id):
+        """Xoá thread trên server; lỗi (thread đã hết hạn/không tồn tại) được bỏ qua."""
+        try:
+            self._call(self.client.beta.threads.delete, thread_id)
+        except Exception as e:
+            logger.info("Could not delete thread %s: %s", thread_id, e)
+
+    def _take_from_pool(self):
+        """Lấy một thread còn hạn từ pool (None nếu pool rỗng)."""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT thread_id FROM assistant_thread_pool
+            WHERE created_at >= ? ORDER BY created_at LIMIT 1
+        ''', (self._expiry_cutoff(),))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('DELETE FROM assistant_thread_pool WHERE thread_id = ?', (row[0],))
+        conn.commit()
+        conn.close()
+        return row[0] if row else None
+
+    def get_thread_id(self, session_id):
+        """Trả về thread_id của session, cấp thread mới (ưu tiên từ pool) nếu chưa có hoặc đã hết hạn."""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT thread_id, last_used_at >= ? FROM assistant_threads WHERE session_id = ?
+        ''', (self._expiry_cutoff(), session_id))
+        row = cursor.fetchone()
+        conn.close()
+        if row and row[1]:
+            self.touch(row[0])
+            return row[0]
+        if row:
+            self._delete_remote_thread(row[0])
+        return self._assign_new_thread(session_id)
+
+    def _assign_new_thread(self, session_id):
+        thread_id = self._take_from_pool() or self._create_remote_thread()
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO assistant_threads (session_id, thread_id, created_at, last_used_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ''', (session_id, thread_id))
+        conn.commit()
+        conn.close()
+        self.refill_pool_async()
+        return thread_id
+
+    def invalidate(self, session_id):
+        """Bỏ thread hiện tại của session (vd. server báo không tồn tại) và cấp thread mới."""
+        return self._assign_new_thread(session_id)
+
+    def touch(self, thread_id):
+        """Cập nhật thời điểm dùng gần nhất của thread."""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE assistant_threads SET last_used_at = CURRENT_TIMESTAMP WHERE thread_id = ?
+        ''', (thread_id,))
+        conn.commit()
+        conn.close()
+
+    def forget(self, session_id, delete_remote=True):
+        """Xoá ánh xạ của session (và thread trên server nếu delete_remote)."""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('SELECT thread_id FROM assistant_threads WHERE session_id = ?', (session_id,))
+        row = cursor.fetchone()
+        cursor.execute('DELETE FROM assistant_threads WHERE session_id = ?', (session_id,))
+        conn.commit()
+        conn.close()
+        if row and delete_remote:
+            self._delete_remote_thread(row[0])
+
+    def expire(self):
+        """Xoá các session và thread trong pool đã hết hạn. Trả về số thread đã dọn."""
+        cutoff = self._expiry_cutoff()
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('SELECT thread_id FROM assistant_threads WHERE last_used_at < ?', (cutoff,))
+        expired = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT thread_id FROM assistant_thread_pool WHERE created_at < ?', (cutoff,))
+        expired += [row[0] for row in cursor.fetchall()]
+        cursor.execute('DELETE FROM assistant_threads WHERE last_used_at < ?', (cutoff,))
+        cursor.execute('DELETE FROM assistant_thread_pool WHERE created_at < ?', (cutoff,))
+        conn.commit()
+        conn.close()
+        for thread_id in expired:
+            self._delete_remote_thread(thread_id)
+        return len(expired)
+
+    def pool_count(self):
+        conn = sqlite3.connect(self.database_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM assistant_thread_pool WHERE created_at >= ?', (self._expiry_cutoff(),))
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def refill_pool(self):
+        """Dọn thread hết hạn rồi tạo thêm thread cho tới khi pool đủ pool_size. Trả về số thread đã tạo."""
+        if not self._refill_lock.acquire(blocking=False):
+            # Đã có một luồng khác đang bổ sung pool
+            return 0
+        created = 0
+        try:
+            # Chạy ở luồng nền nên việc xoá thread hết hạn trên server không làm chậm hội thoại
+            self.expire()
+            while self.pool_count() < self.pool_size:
+                thread_id = self._create_remote_thread()
+                conn = sqlite3.connect(self.database_path, timeout=30)
+                conn.execute('INSERT OR IGNORE INTO assistant_thread_pool (thread_id) VALUES (?)', (thread_id,))
+                conn.commit()
+                conn.close()
+                created += 1
+        except Exception as e:
+            logger.warning("Could not refill thread pool: %s", e)
+        finally:
+            self._refill_lock.release()
+        return created
+
+    def refill_pool_async(self):
+        """Bổ sung pool ở luồng nền để không làm chậm tin nhắn đầu tiên."""
+        if self.pool_size <= 0:
+            return None
+        worker = threading.Thread(target=self.refill_pool, name="thread-pool-refill", daemon=True)
+        worker.start()
+        return worker
@@ -0,0 +1,146 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import requests
+from PIL import Image, ImageOps
+
+# PDFConverter nằm trong tools/pdf-image-converter (tên thư mục có dấu '-' nên không import như package được)
+PDF_CONVERTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf-image-converter')
+
+# Giới hạn kích thước theo cách provider tính token cho ảnh
+DETAIL_PRESETS = {
+    "low": {"max_side": 512, "max_short_side": 512, "quality": 70},
+    "high": {"max_side": 2048, "max_short_side": 768, "quality": 80},
+}
+
+
+class VisionPreprocessor:
+    """Thu nhỏ, nén lại ảnh/PDF đính kèm và chuyển thành data URL base64, có cache theo nội dung."""
+
+    def __init__(self, cache_dir='vision_cache', detail='low', max_pdf_pages=3, pdf_dpi=100, timeout=15):
+        if detail not in DETAIL_PRESETS:
+            raise ValueError(f"Unsupported detail: {detail}")
+        self.cache_dir = cache_dir
+        self.detail = detail
+        self.max_pdf_pages = max_pdf_pages
+        self.pdf_dpi = pdf_dpi
+        self.timeout = timeout
+        self._pdf_converter = None
+        # URL -> content hash, tránh tải lại cùng một file trong một phiên
+        self._url_hashes = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def prepare(self, source):
+        """Trả về danh sách content part 'image_url' (data URL) cho một URL hoặc đường dẫn file."""
+        content_hash = self._url_hashes.get(source)
+        if content_hash is not None:
+            cached = self._load_cache(content_hash)
+            if cached is not None:
+                return self._to_parts(cached)
+
+        data = self._read_source(source)
+        content_hash = self._content_hash(data)
+        self._url_hashes[source] = content_hash
+
+        cached = self._load_cache(content_hash)
+        if cached is None:
+            if data[:5] == b'%PDF-':
+                cached = self._process_pdf(data)
+            else:
+                cached = [self._encode_image(Image.open(io.BytesIO(data)))]
+            self._save_cache(content_hash, cached)
+        return self._to_parts(cached)
+
+    def _to_parts(self, data_urls):
+        return [{"type": "image_url", "image_url": {"url": url, "detail": self.detail}} for url in data_urls]
+
+    def _read_source(self, source):
+        if source.startswith(('http://', 'https://')):
+            response = requests.get(source, timeout=self.timeout)
+            response.raise_for_status()
+            return response.content
+        with open(source, 'rb') as f:
+            return f.read()
+
+    def _content_hash(self, data):
+        """Hash nội dung kèm tham số xử lý, đổi detail/dpi sẽ tạo cache mới."""
+        digest = hashlib.sha256(data)
+        digest.update(f"{self.detail}:{self.max_pdf_pages}:{self.pdf_dpi}".encode())
+        return digest.hexdigest()
+
+    def _cache_path(self, content_hash):
+        return os.path.join(self.cache_dir, f"{content_hash}.json")
+
+    def _load_cache(self, content_hash):
+        path = self._cache_path(content_hash)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_cache(self, content_hash, data_urls):
+        # Ghi ra file tạm rồi đổi tên để không để lại cache hỏng khi bị ngắt giữa chừng
+        path = self._cache_path(content_hash)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data_urls, f)
+        os.replace(tmp_path, path)
+
+    def _get_pdf_converter(self):
+        if self._pdf_converter is None:
+            if PDF_CONVERTER_DIR not in sys.path:
+                sys.path.append(PDF_CONVERTER_DIR)
+            from pdf_to_image import PDFConverter
+            self._pdf_converter = PDFConverter()
+        return self._pdf_converter
+
+    def _process_pdf(self, data):
+        """Raster hoá các trang đầu của PDF bằng PDFConverter rồi nén từng trang."""
+        converter = self._get_pdf_converter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pdf_path = os.path.join(tmp_dir, 'attachment.pdf')
+            with open(pdf_path, 'wb') as f:
+                f.write(data)
+            image_paths = converter.convert_local_pdf(
+                pdf_path=pdf_path,
+                output_dir=os.path.join(tmp_dir, 'pages'),
+                dpi=self.pdf_dpi,
+                fmt='PNG',
+                first_page=1,
+                last_page=self.max_pdf_pages
+            )
+            data_urls = []
+            for image_path in image_paths:
+                with Image.open(image_path) as image:
+                    data_urls.append(self._encode_image(image))
+            return data_urls
+
+    def _encode_image(self, image):
+        """Thu nhỏ theo DETAIL_PRESETS, nén JPEG và trả về data URL."""
+        preset = DETAIL_PRESETS[self.detail]
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG không có kênh alpha, ghép lên nền trắng
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        width, height = image.size
+        scale = min(1.0,
+                    preset["max_side"] / max(width, height),
+                    preset["max_short_side"] / min(width, height))
+        if scale < 1.0:
+            image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=preset["quality"], optimize=True)
+        encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+        return f"data:image/jpeg;base64,{encoded}"
@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from metadata_cache import MetadataCache
+from mock_media_server import MockMediaServer, add_server_arguments, server_options
+from youtube_downloader_cli import YouTubeDownloaderCLI
+
+MB = 1024 * 1024
+
+
+def percentile(samples: List[float], percent: float) -> Optional[float]:
+    if not samples:
+        return None
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/max of a list of seconds, in milliseconds."""
+    return {
+        "p50": round(percentile(samples, 50) * 1000, 1) if samples else None,
+        "p95": round(percentile(samples, 95) * 1000, 1) if samples else None,
+        "max": round(max(samples) * 1000, 1) if samples else None,
+    }
+
+
+def make_downloader(args, output_dir: str, jobs: int = 1,
+                    metadata_cache: Optional[MetadataCache] = None) -> YouTubeDownloaderCLI:
+    downloader = YouTubeDownloaderCLI(metadata_cache, jobs=jobs, per_host=args.per_host or None,
+                                      concurrent_fragments=args.concurrent_fragments)
+    downloader.download_folder = output_dir
+    return downloader
+
+
+def run_single(server: MockMediaServer, args, warm_cache: bool) -> dict:
+    """download_video one URL at a time: setup latency (call to first progress event) and per-video MB/s."""
+    setup_latencies = []
+    rates = []
+    failed = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        metadata_cache = MetadataCache(os.path.join(work_dir, 'metadata.db')) if warm_cache else None
+        downloader = make_downloader(args, os.path.join(work_dir, 'out'), metadata_cache=metadata_cache)
+        os.makedirs(downloader.download_folder)
+        urls = server.video_urls(args.media)
+        if warm_cache:
+            for url in urls:
+                downloader.get_video_info(url)
+
+        first_event = {}
+        original_hook = downloader.progress_hook
+
+        def timed_hook(d, task=None):
+            first_event.setdefault(task, time.perf_counter())
+            original_hook(d, task)
+
+        downloader.progress_hook = timed_hook
+        for url in urls:
+            started = time.perf_counter()
+            if not downloader.download_video(url, args.quality):
+                failed += 1
+                continue
+            finished = time.perf_counter()
+            first = first_event.get(url, finished)
+            setup_latencies.append(first - started)
+            if finished > first:
+                rates.append(server.state.size / MB / (finished - first))
+
+    return {
+        "videos": len(urls),
+        "failed": failed,
+        "setup_latency_ms": latency_summary(setup_latencies),
+        "transfer_mb_s": {
+            "mean": round(sum(rates) / len(rates), 2) if rates else None,
+            "min": round(min(rates), 2) if rates else None,
+        },
+    }
+
+
+def run_multiple(server: MockMediaServer, args, jobs: int) -> dict:
+    """download_multiple over every video with `jobs` workers."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        downloader = make_downloader(args, work_dir, jobs=jobs)
+        report = downloader.download_multiple(server.video_urls(args.media), args.quality)
+    return {
+        "jobs": jobs,
+        "duration_s": round(report.elapsed, 3),
+        "mb_s": round(report.throughput / MB, 2),
+        "succeeded": report.succeeded,
+        "failed": len(report.failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark YouTubeDownloaderCLI against a local synthetic media server')
+    parser.add_argument('-m', '--media', choices=['hls', 'mp4'], default='hls',
+                        help='HLS playlists or progressive MP4 files (default: hls)')
+    parser.add_argument('-q', '--quality', default='720p', help='Requested quality (default: 720p)')
+    parser.add_argument('-j', '--jobs', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Worker counts for the download_multiple runs (default: 1 2 4 8)')
+    parser.add_argument('--per-host', type=int, default=0,
+                        help='Per-host cap for download_multiple, 0 for none (default: 0, all videos share one host)')
+    parser.add_argument('-N', '--concurrent-fragments', type=int, default=1,
+                        help='HLS fragments downloaded in parallel (default: 1)')
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    with MockMediaServer(**server_options(args)) as server:
+        # The progress line and per-video messages would mix with the JSON report
+        with contextlib.redirect_stdout(io.StringIO()):
+            single = run_single(server, args, warm_cache=False)
+            single["warm_cache_setup_latency_ms"] = run_single(server, args, warm_cache=True)["setup_latency_ms"]
+            scaling = [run_multiple(server, args, jobs) for jobs in args.jobs]
+        server_counts = dict(server.state.request_counts)
+        bytes_sent = server.state.bytes_sent
+
+    baseline = scaling[0]["mb_s"] if scaling and scaling[0]["mb_s"] else None
+    for run in scaling:
+        run["speedup"] = round(run["mb_s"] / baseline, 2) if baseline else None
+
+    report = {
+        "media": args.media,
+        "videos": args.videos,
+        "video_size_mb": args.size,
+        "server": {
+            "latency_s": args.latency,
+            "bandwidth_mb_s": args.bandwidth,
+            "link_bandwidth_mb_s": args.link_bandwidth,
+            "segments": args.segments if args.media == 'hls' else None,
+        },
+        "concurrent_fragments": args.concurrent_fragments,
+        "download_video": single,
+        "download_multiple": scaling,
+        "server_requests": server_counts,
+        "server_mb_sent": round(bytes_sent / MB, 2),
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from metadata_cache import cache_key, youtube_video_id
+
+DEFAULT_ARCHIVE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ddn-python-tools", "youtube_archive.db")
+# The GUI keeps its whole download list in a single open-ended job
+GUI_JOB_ID = 'gui'
+
+
+def job_id_for(urls: List[str], quality: str, output_dir: str) -> str:
+    """Stable ID of a batch, so running the same command again resumes the same job."""
+    digest = hashlib.sha1('\n'.join([quality, os.path.abspath(output_dir)] + list(urls)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class DownloadArchive:
+    """
+    Completed downloads and a journal of batch jobs, shared by the CLI and the GUI.
+
+    A download is identified by (video key, quality, output directory), where the video
+    key is the metadata cache key (extractor:id). The index is held in memory, so
+    is_done() answers without any network call or query, either from the YouTube ID in
+    the URL or from URLs seen before. Job items record their state (queued, downloading,
+    done, failed) so an interrupted batch can be resumed; yt-dlp continues .part files.
+    """
+
+    def __init__(self, path: str = DEFAULT_ARCHIVE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._initialize_database()
+        self._load_index()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _initialize_database(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS completed_downloads (
+                video_key TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                output_dir TEXT NOT NULL,
+                filepath TEXT,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (video_key, quality, output_dir)
+            );
+            CREATE TABLE IF NOT EXISTS archive_urls (
+                url TEXT PRIMARY KEY,
+                video_key TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                job_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS download_job_items (
+                job_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                quality TEXT NOT NULL,
+                output_dir TEXT NOT NULL,
+                video_id TEXT,
+                title TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, url)
+            );
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _load_index(self):
+        conn = self._connect()
+        self._completed: Dict[Tuple[str, str, str], Optional[str]] = {
+            (key, quality, output_dir): filepath
+            for key, quality, output_dir, filepath in conn.execute(
+                'SELECT video_key, quality, output_dir, filepath FROM completed_downloads')
+        }
+        self._url_keys: Dict[str, str] = dict(conn.execute('SELECT url, video_key FROM archive_urls'))
+        conn.close()
+
+    # --- Completed downloads ---
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        with self._lock:
+            key = self._url_keys.get(url)
+        if key:
+            return key
+        video_id = youtube_video_id(url)
+        return cache_key('Youtube', video_id) if video_id else None
+
+    def is_done(self, url: str, quality: str, output_dir: str) -> bool:
+        """True if the URL was downloaded at this quality into this folder and the file still exists."""
+        key = self.key_for_url(url)
+        if key is None:
+            return False
+        with self._lock:
+            entry = (key, quality, os.path.abspath(output_dir))
+            if entry not in self._completed:
+                return False
+            filepath = self._completed[entry]
+        return not filepath or os.path.exists(filepath)
+
+    def record(self, url: str, info: dict, quality: str, output_dir: str, filepath: Optional[str] = None):
+        """Remember a finished download of `info` (requested as `url`)."""
+        key = cache_key(info.get('extractor_key') or info.get('extractor') or 'generic', info['id'])
+        output_dir = os.path.abspath(output_dir)
+        urls: Set[str] = {url, info.get('webpage_url'), info.get('original_url')}
+        urls.discard(None)
+        with self._lock:
+            self._completed[(key, quality, output_dir)] = filepath
+            self._url_keys.update((alias, key) for alias in urls)
+        conn = self._connect()
+        conn.execute('''
+            INSERT OR REPLACE INTO completed_downloads (video_key, quality, output_dir, filepath, completed_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, quality, output_dir, filepath, time.time()))
+        conn.executemany('INSERT OR REPLACE INTO archive_urls (url, video_key) VALUES (?, ?)',
+                         [(alias, key) for alias in urls])
+        conn.commit()
+        conn.close()
+
+    # --- Job journal ---
+
+    def start_job(self, job_id: str, urls: List[str], quality: str, output_dir: str) -> int:
+        """Create the job, or reopen it if it exists. Returns the number of items already done."""
+        output_dir = os.path.abspath(output_dir)
+        now = time.time()
+        conn = self._connect()
+        conn.execute('INSERT OR IGNORE INTO download_jobs (job_id, created_at) VALUES (?, ?)', (job_id, now))
+        conn.execute('UPDATE download_jobs SET finished_at = NULL WHERE job_id = ?', (job_id,))
+        conn.executemany('''
+            INSERT OR IGNORE INTO download_job_items (job_id, url, position, quality, output_dir, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(job_id, url, position, quality, output_dir, now) for position, url in enumerate(urls)])
+        done = conn.execute("SELECT COUNT(*) FROM download_job_items WHERE job_id = ? AND status = 'done'",
+                            (job_id,)).fetchone()[0]
+        conn.commit()
+        conn.close()
+        return done
+
+    def add_item(self, job_id: str, url: str, quality: str, output_dir: str,
+                 video_id: Optional[str] = None, title: Optional[str] = None):
+        """Add or update one item of an open-ended job (the GUI queue) and mark it queued."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('INSERT OR IGNORE INTO download_jobs (job_id, created_at) VALUES (?, ?)', (job_id, now))
+        conn.execute('''
+            INSERT INTO download_job_items (job_id, url, position, quality, output_dir, video_id, title, updated_at)
+            VALUES (?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM download_job_items WHERE job_id = ?),
+                    ?, ?, ?, ?, ?)
+            ON CONFLICT (job_id, url) DO UPDATE SET
+                quality = excluded.quality, output_dir = excluded.output_dir, video_id = excluded.video_id,
+                title = excluded.title, status = 'queued', error = NULL, updated_at = excluded.updated_at
+        ''', (job_id, url, job_id, quality, os.path.abspath(output_dir), video_id, title, now))
+        conn.commit()
+        conn.close()
+
+    def update_item(self, job_id: str, url: str, status: str, error: Optional[str] = None):
+        conn = self._connect()
+        conn.execute('''
+            UPDATE download_job_items SET status = ?, error = ?, updated_at = ? WHERE job_id = ? AND url = ?
+        ''', (status, error, time.time(), job_id, url))
+        conn.commit()
+        conn.close()
+
+    def remove_item(self, job_id: str, url: str):
+        conn = self._connect()
+        conn.execute('DELETE FROM download_job_items WHERE job_id = ? AND url = ?', (job_id, url))
+        conn.commit()
+        conn.close()
+
+    def unfinished_items(self, job_id: str) -> List[dict]:
+        """Items not downloaded yet, interrupted downloads first, then in queue order."""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute('''
+            SELECT url, quality, output_dir, video_id, title, status, error FROM download_job_items
+            WHERE job_id = ? AND status != 'done'
+            ORDER BY status != 'downloading', position
+        ''', (job_id,)).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def finish_job(self, job_id: str):
+        conn = self._connect()
+        conn.execute('UPDATE download_jobs SET finished_at = ? WHERE job_id = ?', (time.time(), job_id))
+        conn.commit()
+        conn.close()
+
+    def last_unfinished_job(self) -> Optional[Tuple[str, List[str], str, str]]:
+        """(job_id, urls, quality, output_dir) of the most recent unfinished CLI job, or None."""
+        conn = self._connect()
+        row = conn.execute('''
+            SELECT job_id FROM download_jobs WHERE finished_at IS NULL AND job_id != ?
+            ORDER BY created_at DESC LIMIT 1
+        ''', (GUI_JOB_ID,)).fetchone()
+        if not row:
+            conn.close()
+            return None
+        items = conn.execute('''
+            SELECT url, quality, output_dir FROM download_job_items WHERE job_id = ? ORDER BY position
+        ''', (row[0],)).fetchall()
+        conn.close()
+        if not items:
+            return None
+        return row[0], [url for url, _, _ in items], items[0][1], items[0][2]
@@ -0,0 +1,103 @@
+import heapq
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+
+class DownloadManager:
+    """
+    Priority download queue with a bounded number of concurrent downloads.
+
+    Queued items start in priority order (lower value first, FIFO within a priority)
+    as soon as fewer than `max_concurrency` downloads are running. The download
+    callable runs in a worker thread and must not touch the UI: it reports through
+    publish(), which keeps only the latest status per item, and the UI thread
+    collects the pending statuses with drain() on its own schedule.
+    """
+
+    def __init__(self, download: Callable[[str], None], max_concurrency: int = 3):
+        self.download = download
+        self.max_concurrency = max(1, max_concurrency)
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[int, int, str]] = []
+        self._queued: Dict[str, int] = {}
+        self._running: Dict[str, threading.Thread] = {}
+        self._counter = itertools.count()
+        self._updates: Dict[str, str] = {}
+
+    def enqueue(self, item_id: str, priority: int = PRIORITY_NORMAL) -> bool:
+        """Queue an item, or move an already queued item to a new priority.
+
+        Returns False when the item is already downloading.
+        """
+        with self._lock:
+            if item_id in self._running:
+                return False
+            # Older heap entries of a re-queued item are skipped when popped
+            self._queued[item_id] = priority
+            heapq.heappush(self._heap, (priority, next(self._counter), item_id))
+            self._updates[item_id] = 'Queued'
+            self._start_next()
+        return True
+
+    def cancel(self, item_id: str) -> bool:
+        """Remove a queued item; a running download is not interrupted."""
+        with self._lock:
+            return self._queued.pop(item_id, None) is not None
+
+    def set_max_concurrency(self, max_concurrency: int):
+        with self._lock:
+            self.max_concurrency = max(1, max_concurrency)
+            self._start_next()
+
+    def is_active(self, item_id: str) -> bool:
+        with self._lock:
+            return item_id in self._queued or item_id in self._running
+
+    def counts(self) -> Tuple[int, int]:
+        """(running, queued)"""
+        with self._lock:
+            return len(self._running), len(self._queued)
+
+    def publish(self, item_id: str, status: str):
+        """Record the latest status of an item (called from worker threads)."""
+        with self._lock:
+            self._updates[item_id] = status
+
+    def drain(self) -> Dict[str, str]:
+        """Latest status of every item that changed since the previous call."""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        return updates
+
+    def _pop_next(self) -> Optional[str]:
+        while self._heap:
+            priority, _, item_id = heapq.heappop(self._heap)
+            if self._queued.get(item_id) == priority:
+                del self._queued[item_id]
+                return item_id
+        return None
+
+    def _start_next(self):
+        # Called with the lock held
+        while len(self._running) < self.max_concurrency:
+            item_id = self._pop_next()
+            if item_id is None:
+                return
+            thread = threading.Thread(target=self._run, args=(item_id,), daemon=True,
+                                      name=f"download-{item_id}")
+            self._running[item_id] = thread
+            thread.start()
+
+    def _run(self, item_id: str):
+        try:
+            self.download(item_id)
+        except Exception as e:
+            self.publish(item_id, f"Error: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.pop(item_id, None)
+                self._start_next()
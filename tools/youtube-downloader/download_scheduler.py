@@ -0,0 +1,257 @@
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+# Hosts that serve the same site under another name share one concurrency cap
+HOST_ALIASES = {'youtu.be': 'youtube.com', 'youtube-nocookie.com': 'youtube.com'}
+
+
+def host_key(url: str) -> str:
+    """Normalized host of a URL, used for per-host concurrency caps."""
+    host = (urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return HOST_ALIASES.get(host, host)
+
+
+def format_bytes(count: float) -> str:
+    if count < 1024:
+        return f"{int(count)} B"
+    for unit in ('KB', 'MB', 'GB'):
+        count /= 1024
+        if count < 1024 or unit == 'GB':
+            return f"{count:.1f} {unit}"
+
+
+class TokenBucket:
+    """Bandwidth limit shared by all download threads (bytes per second)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        """Take amount bytes from the bucket, sleeping while the bucket is in debt."""
+        if amount <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass
+class TaskProgress:
+    url: str
+    status: str = 'queued'
+    files: Dict[str, List[int]] = field(default_factory=dict)
+    error: Optional[str] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def downloaded(self) -> int:
+        return sum(done for done, _ in self.files.values())
+
+    @property
+    def total(self) -> int:
+        return sum(total for _, total in self.files.values())
+
+
+class ProgressBoard:
+    """
+    Progress of every download in a batch, rendered as one aggregated status line.
+
+    Download threads report through update(); the line is redrawn at most every
+    `interval` seconds by whichever thread reports, so no thread writes per chunk.
+    """
+
+    def __init__(self, stream=None, interval: float = 0.5,
+                 bandwidth: Optional[TokenBucket] = None):
+        self.stream = stream or sys.stdout
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        # Without a terminal the line cannot be redrawn in place, so print it less often
+        self.interval = interval if self.tty else max(interval, 5.0)
+        self.bandwidth = bandwidth
+        self.tasks: Dict[str, TaskProgress] = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._last_render = 0.0
+        self._line_width = 0
+
+    def add(self, task: str, url: str):
+        with self._lock:
+            self.tasks.setdefault(task, TaskProgress(url))
+
+    def start(self, task: str):
+        with self._lock:
+            progress = self.tasks.setdefault(task, TaskProgress(task))
+            progress.status = 'downloading'
+            progress.started = time.monotonic()
+
+    def update(self, task: str, d: dict):
+        """progress_hooks callback body: record the chunk, throttle, redraw if due."""
+        filename = d.get('filename') or d.get('tmpfilename') or ''
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        with self._lock:
+            progress = self.tasks.setdefault(task, TaskProgress(task))
+            previous = progress.files.get(filename, [0, 0])[0]
+            if d['status'] == 'finished':
+                downloaded = total = max(downloaded, total, previous)
+            progress.files[filename] = [downloaded, max(total, downloaded)]
+        if self.bandwidth is not None:
+            self.bandwidth.consume(downloaded - previous)
+        self.render()
+
+    def skip(self, task: str):
+        """Mark a task that needed no download (already in the archive)."""
+        with self._lock:
+            self.tasks.setdefault(task, TaskProgress(task)).status = 'skipped'
+
+    def finish(self, task: str, ok: bool, error: Optional[str] = None):
+        with self._lock:
+            progress = self.tasks.setdefault(task, TaskProgress(task))
+            progress.status = 'done' if ok else 'failed'
+            progress.error = error
+            progress.finished = time.monotonic()
+        self.render(force=True)
+
+    def log(self, message: str):
+        """Print a message above the status line."""
+        with self._lock:
+            self._clear_line()
+            self.stream.write(message + '\n')
+            self.stream.flush()
+            self._last_render = 0.0
+
+    def downloaded_bytes(self) -> int:
+        with self._lock:
+            return sum(progress.downloaded for progress in self.tasks.values())
+
+    def status_line(self) -> str:
+        counts = Counter(progress.status for progress in self.tasks.values())
+        active = [progress for progress in self.tasks.values() if progress.status == 'downloading']
+        downloaded = sum(progress.downloaded for progress in self.tasks.values())
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        line = (f"[{counts['done'] + counts['skipped']}/{len(self.tasks)} done, {len(active)} active, "
+                f"{counts['failed']} failed] {format_bytes(downloaded)} at {format_bytes(downloaded / elapsed)}/s")
+        if len(active) == 1 and active[0].total:
+            line += f" ({active[0].downloaded / active[0].total * 100:.1f}%)"
+        return line
+
+    def render(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_render < self.interval:
+            return
+        with self._lock:
+            self._last_render = now
+            line = self.status_line()
+            if self.tty:
+                self.stream.write('\r' + line.ljust(self._line_width))
+                self._line_width = len(line)
+            else:
+                self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def _clear_line(self):
+        if self.tty and self._line_width:
+            self.stream.write('\r' + ' ' * self._line_width + '\r')
+            self._line_width = 0
+
+
+@dataclass
+class DownloadReport:
+    total: int
+    # Downloaded in this run; videos skipped as already downloaded are counted in `skipped`
+    succeeded: int
+    failures: Dict[str, str]
+    downloaded_bytes: int
+    elapsed: float
+    skipped: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Average bytes per second over the whole batch."""
+        return self.downloaded_bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        lines = [
+            f"Completed: {self.succeeded}/{self.total} videos downloaded successfully",
+            f"Downloaded {format_bytes(self.downloaded_bytes)} in {self.elapsed:.1f}s "
+            f"({format_bytes(self.throughput)}/s)",
+        ]
+        if self.skipped:
+            lines.insert(1, f"Skipped {self.skipped} already downloaded")
+        if self.failures:
+            lines.append(f"Failed ({len(self.failures)}):")
+            lines.extend(f"  {url}: {error}" for url, error in self.failures.items())
+        return '\n'.join(lines)
+
+
+class DownloadScheduler:
+    """
+    Runs downloads on a bounded pool of worker threads.
+
+    At most `jobs` downloads run at once and at most `per_host` of them against the
+    same host; a worker takes the oldest queued URL whose host still has a free slot.
+    `download` is called as download(url, task) and returns True on success.
+    """
+
+    def __init__(self, download: Callable[[str, str], bool], jobs: int = 4, per_host: Optional[int] = 2):
+        self.download = download
+        self.jobs = max(1, jobs)
+        self.per_host = per_host
+        self._condition = threading.Condition()
+        self._queue: List[str] = []
+        self._running = Counter()
+
+    def _next_url(self) -> Optional[str]:
+        for index, url in enumerate(self._queue):
+            if not self.per_host or self._running[host_key(url)] < self.per_host:
+                return self._queue.pop(index)
+        return None
+
+    def _worker(self, results: Dict[str, bool]):
+        while True:
+            with self._condition:
+                url = self._next_url()
+                while url is None:
+                    if not self._queue:
+                        return
+                    self._condition.wait()
+                    url = self._next_url()
+                self._running[host_key(url)] += 1
+            try:
+                results[url] = self.download(url, url)
+            except Exception:
+                results[url] = False
+            finally:
+                with self._condition:
+                    self._running[host_key(url)] -= 1
+                    self._condition.notify_all()
+
+    def run(self, urls: List[str]) -> Dict[str, bool]:
+        """Download every URL (duplicates are downloaded once); returns url -> success."""
+        self._queue = list(dict.fromkeys(urls))
+        results: Dict[str, bool] = {}
+        workers = [threading.Thread(target=self._worker, args=(results,), name=f'download-{i}', daemon=True)
+                   for i in range(min(self.jobs, len(self._queue)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
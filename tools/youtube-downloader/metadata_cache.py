@@ -0,0 +1,119 @@
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ddn-python-tools", "youtube_metadata.db")
+# Signed stream URLs in YouTube formats expire after about 6 hours
+DEFAULT_TTL = 3 * 3600
+
+YOUTUBE_ID_PATTERN = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)([\w-]{11})'
+)
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """Return the YouTube video ID of a URL without any network call, or None."""
+    match = YOUTUBE_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def cache_key(extractor_key: str, video_id: str) -> str:
+    return f"{extractor_key}:{video_id}"
+
+
+class MetadataCache:
+    """Persistent cache of yt-dlp info dicts keyed by extractor and video ID, with a TTL."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_database()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _initialize_database(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS video_metadata (
+                key TEXT PRIMARY KEY,
+                title TEXT,
+                info BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS video_urls (
+                url TEXT PRIMARY KEY,
+                key TEXT NOT NULL
+            );
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _key_for_url(self, conn, url: str) -> Optional[str]:
+        row = conn.execute('SELECT key FROM video_urls WHERE url = ?', (url,)).fetchone()
+        if row:
+            return row[0]
+        video_id = youtube_video_id(url)
+        return cache_key('Youtube', video_id) if video_id else None
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """Cached info dict for a key, or None when missing or older than the TTL."""
+        max_age = self.ttl if max_age is None else max_age
+        conn = self._connect()
+        row = conn.execute('SELECT info, fetched_at FROM video_metadata WHERE key = ?', (key,)).fetchone()
+        conn.close()
+        if not row or time.time() - row[1] > max_age:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def get_by_url(self, url: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """Cached info dict for a URL (known alias or parsed YouTube ID)."""
+        conn = self._connect()
+        key = self._key_for_url(conn, url)
+        conn.close()
+        return self.get(key, max_age) if key else None
+
+    def contains(self, url: str, max_age: Optional[float] = None) -> bool:
+        return self.get_by_url(url, max_age) is not None
+
+    def put(self, url: str, info: dict) -> str:
+        """Store a sanitized info dict and remember the URL it came from. Returns the cache key."""
+        key = cache_key(info.get('extractor_key') or info.get('extractor') or 'generic', info['id'])
+        data = zlib.compress(json.dumps(info, ensure_ascii=False).encode('utf-8'), 6)
+        conn = self._connect()
+        conn.execute('''
+            INSERT OR REPLACE INTO video_metadata (key, title, info, fetched_at) VALUES (?, ?, ?, ?)
+        ''', (key, info.get('title'), data, time.time()))
+        urls = {url, info.get('webpage_url'), info.get('original_url')}
+        conn.executemany('INSERT OR REPLACE INTO video_urls (url, key) VALUES (?, ?)',
+                         [(alias, key) for alias in urls if alias])
+        conn.commit()
+        conn.close()
+        return key
+
+    def invalidate(self, url: str):
+        """Drop the cached entry for a URL (e.g. after its stream URLs expired)."""
+        conn = self._connect()
+        key = self._key_for_url(conn, url)
+        if key:
+            conn.execute('DELETE FROM video_metadata WHERE key = ?', (key,))
+            conn.commit()
+        conn.close()
+
+    def prune(self) -> int:
+        """Delete entries older than the TTL. Returns the number of removed entries."""
+        conn = self._connect()
+        cursor = conn.execute('DELETE FROM video_metadata WHERE fetched_at < ?', (time.time() - self.ttl,))
+        removed = cursor.rowcount
+        conn.execute('DELETE FROM video_urls WHERE key NOT IN (SELECT key FROM video_metadata)')
+        conn.commit()
+        conn.close()
+        return removed
@@ -0,0 +1,263 @@
+import argparse
+import os
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from download_scheduler import TokenBucket
+
+# Local server with synthetic media for offline downloader benchmarks.
+# yt-dlp's generic extractor accepts every URL it serves:
+#   /hls/<name>.m3u8        HLS master playlist (720p) -> /hls/<name>/media.m3u8 -> /hls/<name>/seg<N>.ts
+#   /media/<name>.mp4       progressive file (supports Range requests)
+#   /feed.xml               RSS playlist of all videos
+
+CHUNK_SIZE = 16 * 1024
+# Repeated to build every response body, so no media is generated or stored per request
+PATTERN = os.urandom(64 * 1024)
+
+HLS_MASTER_PATH = re.compile(r'^/hls/(?P<name>[\w-]+)\.m3u8$')
+HLS_MEDIA_PATH = re.compile(r'^/hls/(?P<name>[\w-]+)/media\.m3u8$')
+HLS_SEGMENT_PATH = re.compile(r'^/hls/(?P<name>[\w-]+)/seg(?P<index>\d+)\.ts$')
+MP4_PATH = re.compile(r'^/media/(?P<name>[\w-]+)\.mp4$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class MockMediaState:
+    """Catalogue and network shaping of the mock server."""
+
+    def __init__(self, videos: int = 8, size: int = 4 * 1024 * 1024, segments: int = 8,
+                 latency: float = 0.0, bandwidth: Optional[float] = None,
+                 link_bandwidth: Optional[float] = None):
+        self.names = [f"video{i:03d}" for i in range(videos)]
+        self.size = size
+        self.segments = max(1, segments)
+        # Seconds before every response starts (time to first byte)
+        self.latency = latency
+        # Bytes/s of each connection, and of all connections together
+        self.bandwidth = bandwidth
+        self.link = TokenBucket(link_bandwidth, burst=CHUNK_SIZE * 4) if link_bandwidth else None
+        self.lock = threading.Lock()
+        self.request_counts = Counter()
+        self.bytes_sent = 0
+
+    def count(self, kind: str, sent: int = 0):
+        with self.lock:
+            self.request_counts[kind] += 1
+            self.bytes_sent += sent
+
+    def segment_size(self, index: int) -> int:
+        base = self.size // self.segments
+        return base + (self.size % self.segments if index == self.segments - 1 else 0)
+
+
+class MockMediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> MockMediaState:
+        return self.server.state
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def _handle(self, send_body: bool):
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        path = self.path.split('?', 1)[0]
+        state = self.state
+
+        if path == '/feed.xml':
+            return self._send_text('feed', self._feed(), 'application/rss+xml', send_body)
+        match = HLS_MASTER_PATH.match(path)
+        if match and match['name'] in state.names:
+            playlist = ('#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720\n'
+                        f"{match['name']}/media.m3u8\n")
+            return self._send_text('master', playlist, 'application/vnd.apple.mpegurl', send_body)
+        match = HLS_MEDIA_PATH.match(path)
+        if match and match['name'] in state.names:
+            lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+            for index in range(state.segments):
+                lines += ['#EXTINF:4.0,', f'seg{index}.ts']
+            lines.append('#EXT-X-ENDLIST')
+            return self._send_text('media', '\n'.join(lines) + '\n', 'application/vnd.apple.mpegurl', send_body)
+        match = HLS_SEGMENT_PATH.match(path)
+        if match and match['name'] in state.names and int(match['index']) < state.segments:
+            return self._send_media('segment', state.segment_size(int(match['index'])), 'video/mp2t', send_body)
+        match = MP4_PATH.match(path)
+        if match and match['name'] in state.names:
+            return self._send_media('mp4', state.size, 'video/mp4', send_body)
+
+        self.state.count('not_found')
+        self.send_error(404)
+
+    def _feed(self) -> str:
+        host = self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]
+        items = ''.join(
+            f'<item><title>{name}</title><link>http://{host}/hls/{name}.m3u8</link>'
+            f'<enclosure url="http://{host}/hls/{name}.m3u8" type="application/x-mpegURL"/></item>'
+            for name in self.state.names
+        )
+        return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Mock feed</title>{items}</channel></rss>'
+
+    def _send_text(self, kind: str, text: str, content_type: str, send_body: bool):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+        self.state.count(kind, len(body) if send_body else 0)
+
+    def _send_media(self, kind: str, size: int, content_type: str, send_body: bool):
+        start, end = 0, size - 1
+        match = RANGE_HEADER.match(self.headers.get('Range', ''))
+        if match and (match[1] or match[2]):
+            if match[1]:
+                start = int(match[1])
+                end = min(int(match[2]), size - 1) if match[2] else size - 1
+            else:
+                start = max(0, size - int(match[2]))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        length = end - start + 1
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        sent = 0
+        if send_body:
+            try:
+                sent = self._write_shaped(start, length)
+            except ConnectionError:
+                # yt-dlp's generic extractor only reads the headers of a media URL, then hangs up
+                self.close_connection = True
+                sent = -1
+        self.state.count(kind if sent >= 0 else f'{kind}_aborted', max(sent, 0))
+
+    def _write_shaped(self, offset: int, length: int) -> int:
+        """Write `length` synthetic bytes at the connection and link bandwidth limits."""
+        state = self.state
+        started = time.monotonic()
+        sent = 0
+        while sent < length:
+            position = (offset + sent) % len(PATTERN)
+            chunk = PATTERN[position:position + min(CHUNK_SIZE, length - sent)]
+            if state.link is not None:
+                state.link.consume(len(chunk))
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if state.bandwidth:
+                delay = sent / state.bandwidth - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        return sent
+
+
+class MockMediaServer:
+    """Runs the mock media server on a background thread; usable as a context manager."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **state_options):
+        self.httpd = ThreadingHTTPServer((host, port), MockMediaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = MockMediaState(**state_options)
+        self.thread = None
+
+    @property
+    def state(self) -> MockMediaState:
+        return self.httpd.state
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def video_urls(self, media: str = 'hls') -> List[str]:
+        if media == 'mp4':
+            return [f"{self.base_url}/media/{name}.mp4" for name in self.state.names]
+        return [f"{self.base_url}/hls/{name}.m3u8" for name in self.state.names]
+
+    @property
+    def feed_url(self) -> str:
+        return f"{self.base_url}/feed.xml"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def add_server_arguments(parser):
+    """Catalogue and shaping options, shared with benchmark.py."""
+    parser.add_argument('--videos', type=int, default=8, help='Number of synthetic videos (default: 8)')
+    parser.add_argument('--size', type=float, default=4.0, help='Size of each video in MB (default: 4)')
+    parser.add_argument('--segments', type=int, default=8, help='HLS segments per video (default: 8)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds before every response starts (default: 0)')
+    parser.add_argument('--bandwidth', type=float,
+                        help='MB/s per connection (default: unlimited)')
+    parser.add_argument('--link-bandwidth', type=float,
+                        help='MB/s shared by all connections (default: unlimited)')
+
+
+def server_options(args) -> dict:
+    mb = 1024 * 1024
+    return {
+        'videos': args.videos,
+        'size': int(args.size * mb),
+        'segments': args.segments,
+        'latency': args.latency,
+        'bandwidth': args.bandwidth * mb if args.bandwidth else None,
+        'link_bandwidth': args.link_bandwidth * mb if args.link_bandwidth else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local server with synthetic media for downloader benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockMediaServer(args.host, args.port, **server_options(args))
+    print(f"Mock media server listening on {server.base_url}")
+    print(f"Playlist: {server.feed_url}")
+    print(f"First video: {server.video_urls()[0]}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+import yt_dlp
+
+from metadata_cache import MetadataCache, youtube_video_id
+
+# Flat entries of these extractors are playlists themselves (channel tabs, nested playlists)
+PLAYLIST_IE_KEYS = {'YoutubeTab', 'YoutubePlaylist'}
+
+
+class URLResolver:
+    """
+    Resolves pasted URLs to videos on a background thread pool.
+
+    Results are put on `results` as ('video', url, info) or ('error', url, message)
+    for the UI thread to consume; nothing here touches Tk. Playlists and channels are
+    extracted with extract_flat and their entries are read page by page, so the first
+    videos are reported before the whole playlist has been fetched. A video ID is
+    reported only once (see forget()), and videos found in the metadata cache are
+    reported without any network call.
+    """
+
+    def __init__(self, max_workers: int = 4, metadata_cache: Optional[MetadataCache] = None):
+        self.metadata_cache = metadata_cache
+        self.results: queue.Queue = queue.Queue()
+        self.ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='url-resolver')
+        self._lock = threading.Lock()
+        self._seen: Set[str] = set()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of URLs still being resolved."""
+        with self._lock:
+            return self._pending
+
+    def resolve(self, urls):
+        for url in urls:
+            url = url.strip()
+            if url:
+                self._submit(url)
+
+    def forget(self, video_id: str):
+        """Allow a video to be reported again (e.g. after its row was removed)."""
+        with self._lock:
+            self._seen.discard(video_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, url: str):
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._run, url)
+
+    def _claim(self, video_id: str) -> bool:
+        """Mark a video ID as reported; False if it already was."""
+        with self._lock:
+            if video_id in self._seen:
+                return False
+            self._seen.add(video_id)
+            return True
+
+    def _run(self, url: str):
+        try:
+            self._resolve(url)
+        except Exception as e:
+            # Let the user paste the URL again to retry
+            video_id = youtube_video_id(url)
+            if video_id:
+                self.forget(video_id)
+            self.results.put(('error', url, str(e)))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _resolve(self, url: str):
+        # A known video needs no network call at all
+        video_id = youtube_video_id(url)
+        if video_id and not self._claim(video_id):
+            return
+        if self._from_cache(url, claimed=bool(video_id)):
+            return
+
+        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            result_type = info.get('_type', 'video')
+            if result_type in ('url', 'url_transparent'):
+                if video_id:
+                    self.forget(video_id)
+                self._resolve(info['url'])
+            elif result_type == 'playlist':
+                self._expand(info)
+            elif video_id or self._claim(info['id']):
+                try:
+                    info = ydl.sanitize_info(ydl.process_ie_result(info, download=False))
+                except Exception:
+                    # _run() only releases an ID found in the URL; release the one claimed here too
+                    if not video_id:
+                        self.forget(info['id'])
+                    raise
+                if self.metadata_cache is not None:
+                    self.metadata_cache.put(url, info)
+                self.results.put(('video', url, info))
+
+    def _from_cache(self, url: str, claimed: bool) -> bool:
+        """Report a cached video; True if the cache had it (even when it was a duplicate)."""
+        if self.metadata_cache is None:
+            return False
+        info = self.metadata_cache.get_by_url(url)
+        if info is None:
+            return False
+        if claimed or self._claim(info['id']):
+            self.results.put(('video', url, info))
+        return True
+
+    def _expand(self, playlist: dict):
+        """Report the entries of a flat playlist as its pages arrive."""
+        for entry in playlist.get('entries') or []:
+            if not entry:
+                continue
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if entry.get('_type') == 'playlist' or entry.get('ie_key') in PLAYLIST_IE_KEYS:
+                # Channel tabs and nested playlists are expanded by another worker
+                if entry_url:
+                    self._submit(entry_url)
+                continue
+            if not entry_url:
+                continue
+            if not entry.get('id'):
+                # Feeds and generic pages list bare links: resolve them like pasted URLs
+                self._submit(entry_url)
+                continue
+            if not self._claim(entry['id']):
+                continue
+            if not self._from_cache(entry_url, claimed=True):
+                self.results.put(('video', entry_url, entry))
@@ -1,82 +1,200 @@
 import yt_dlp
 import argparse
 import os
-from typing import List, Dict
-import sys
+import time
+from typing import List, Dict, Optional, Tuple
+
+from download_archive import DEFAULT_ARCHIVE_PATH, DownloadArchive, job_id_for
+from download_scheduler import DownloadReport, DownloadScheduler, ProgressBoard, TokenBucket
+from metadata_cache import DEFAULT_CACHE_PATH, DEFAULT_TTL, MetadataCache
 
 class YouTubeDownloaderCLI:
-    def __init__(self):
+    def __init__(self, metadata_cache: Optional[MetadataCache] = None, jobs: int = 1,
+                 per_host: Optional[int] = 2, rate_limit: Optional[float] = None,
+                 concurrent_fragments: int = 1, archive: Optional[DownloadArchive] = None):
         self.download_folder = os.path.expanduser("~/Downloads")
         self.qualities = ['2160p', '1440p', '1080p', '720p', '480p', '360p']
-        
-    def progress_hook(self, d):
-        """Display download progress"""
-        if d['status'] == 'downloading':
-            if 'total_bytes' in d:
-                progress = (d['downloaded_bytes'] / d['total_bytes']) * 100
-                sys.stdout.write(f"\rDownloading: {progress:.1f}%")
-            else:
-                sys.stdout.write(f"\rDownloading: {d['downloaded_bytes']} bytes")
-            sys.stdout.flush()
-        elif d['status'] == 'finished':
-            print("\nDownload completed!")
-
-    def download_video(self, url: str, quality: str = '720p', custom_title: str = None) -> bool:
+        self.metadata_cache = metadata_cache
+        # Index of finished downloads and journal of batch jobs (None = always download)
+        self.archive = archive
+        self.jobs = jobs
+        self.per_host = per_host
+        self.concurrent_fragments = concurrent_fragments
+        # Total bytes/s across all concurrent downloads (None = unlimited)
+        self.rate_limit = rate_limit
+        self.bandwidth = TokenBucket(rate_limit) if rate_limit else None
+        self.progress = ProgressBoard(bandwidth=self.bandwidth)
+
+    def progress_hook(self, d, task: Optional[str] = None):
+        """Report download progress to the aggregated progress view"""
+        self.progress.update(task or d.get('info_dict', {}).get('webpage_url', ''), d)
+
+    def get_video_info(self, url: str) -> Tuple[dict, bool]:
+        """Return (info, from_cache), extracting the page only on a cache miss"""
+        if self.metadata_cache is not None:
+            info = self.metadata_cache.get_by_url(url)
+            if info is not None:
+                return info, True
+        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        if self.metadata_cache is not None:
+            self.metadata_cache.put(url, info)
+        return info, False
+
+    def download_video(self, url: str, quality: str = '720p', custom_title: str = None,
+                       task: Optional[str] = None, job_id: Optional[str] = None) -> bool:
         """Download a single video"""
+        task = task or url
+        # Finished downloads are skipped before any network call
+        if self.archive is not None and self.archive.is_done(url, quality, self.download_folder):
+            self.progress.skip(task)
+            self.progress.log(f"Already downloaded: {url}")
+            if job_id:
+                self.archive.update_item(job_id, url, 'done')
+            return True
+
+        self.progress.start(task)
+        if job_id:
+            self.archive.update_item(job_id, url, 'downloading')
         try:
-            # Get video info first
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = custom_title or info.get('title')
-                print(f"\nVideo title: {title}")
+            # Get video info first (cached info skips the metadata round-trip)
+            info, from_cache = self.get_video_info(url)
+            title = custom_title or info.get('title')
+            self.progress.log(f"Video title: {title}")
 
             # Download options
             ydl_opts = {
-                'format': f'bestvideo[height<={quality[:-1]}]+bestaudio/best[height<={quality[:-1]}]',
+                'format': f'bestvideo[height<=?{quality[:-1]}]+bestaudio/best[height<=?{quality[:-1]}]',
                 'outtmpl': os.path.join(self.download_folder, f'{title}.%(ext)s'),
-                'progress_hooks': [self.progress_hook],
+                'progress_hooks': [lambda d: self.progress_hook(d, task)],
+                'concurrent_fragment_downloads': self.concurrent_fragments,
+                'quiet': True,
+                'noprogress': True,
             }
+            if self.rate_limit:
+                # No single download may exceed the shared limit either
+                ydl_opts['ratelimit'] = self.rate_limit
 
-            # Download video
+            # Download from the extracted info instead of extracting the page again
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+                try:
+                    result = ydl.process_ie_result(info, download=True)
+                except yt_dlp.utils.DownloadError:
+                    if not from_cache:
+                        raise
+                    # Stream URLs in cached info may have expired: extract again once
+                    self.metadata_cache.invalidate(url)
+                    result = ydl.extract_info(url, download=True)
+            if self.archive is not None:
+                downloads = result.get('requested_downloads') or [{}]
+                self.archive.record(url, result, quality, self.download_folder, downloads[0].get('filepath'))
+                if job_id:
+                    self.archive.update_item(job_id, url, 'done')
+            self.progress.finish(task, True)
+            self.progress.log(f"Download completed: {title}")
             return True
 
         except Exception as e:
-            print(f"\nError downloading video: {str(e)}")
+            if job_id:
+                self.archive.update_item(job_id, url, 'failed', str(e))
+            self.progress.finish(task, False, str(e))
+            self.progress.log(f"Error downloading video: {str(e)}")
             return False
 
-    def download_multiple(self, urls: List[str], quality: str = '720p'):
-        """Download multiple videos"""
-        total = len(urls)
-        success = 0
+    def download_multiple(self, urls: List[str], quality: str = '720p') -> DownloadReport:
+        """Download multiple videos, up to self.jobs at a time"""
+        unique_urls = list(dict.fromkeys(urls))
+        self.progress = ProgressBoard(bandwidth=self.bandwidth)
+        for url in unique_urls:
+            self.progress.add(url, url)
+
+        job_id = None
+        order = unique_urls
+        if self.archive is not None:
+            # The same URLs, quality and folder reopen the journal of an interrupted run
+            job_id = job_id_for(unique_urls, quality, self.download_folder)
+            done = self.archive.start_job(job_id, unique_urls, quality, self.download_folder)
+            if done:
+                print(f"\nResuming job {job_id}: {done}/{len(unique_urls)} videos already done")
+            # Interrupted downloads first, so their partial files are continued
+            remaining = [item['url'] for item in self.archive.unfinished_items(job_id)]
+            order = remaining + [url for url in unique_urls if url not in remaining]
 
-        print(f"\nStarting download of {total} videos...")
-        for i, url in enumerate(urls, 1):
-            print(f"\nProcessing video {i}/{total}")
-            if self.download_video(url, quality):
-                success += 1
+        print(f"\nStarting download of {len(unique_urls)} videos ({self.jobs} at a time)...")
+        started = time.monotonic()
+        scheduler = DownloadScheduler(lambda url, task: self.download_video(url, quality, task=task, job_id=job_id),
+                                      jobs=self.jobs, per_host=self.per_host)
+        results = scheduler.run(order)
 
-        print(f"\nCompleted: {success}/{total} videos downloaded successfully")
+        failures = {url: self.progress.tasks[url].error or 'failed'
+                    for url in unique_urls if not results.get(url)}
+        skipped = sum(1 for progress in self.progress.tasks.values() if progress.status == 'skipped')
+        # Videos already in the archive were not downloaded: report them apart from the downloads
+        report = DownloadReport(total=len(unique_urls), succeeded=len(unique_urls) - len(failures) - skipped,
+                                failures=failures, downloaded_bytes=self.progress.downloaded_bytes(),
+                                elapsed=time.monotonic() - started, skipped=skipped)
+        if job_id and not failures:
+            self.archive.finish_job(job_id)
+        self.progress.log('')
+        print(report.summary())
+        return report
 
 def main():
     parser = argparse.ArgumentParser(description='YouTube Video Downloader CLI')
-    parser.add_argument('-u', '--urls', nargs='+', required=True,
+    parser.add_argument('-u', '--urls', nargs='+',
                         help='YouTube URLs to download (space-separated)')
     parser.add_argument('-q', '--quality', choices=['2160p', '1440p', '1080p', '720p', '480p', '360p'],
                         default='720p', help='Video quality (default: 720p)')
     parser.add_argument('-o', '--output', help='Output directory (default: ~/Downloads)')
-    
+    parser.add_argument('-j', '--jobs', type=int, default=3, help='Videos downloaded at the same time (default: 3)')
+    parser.add_argument('--per-host', type=int, default=2,
+                        help='Concurrent downloads per site, 0 for no cap (default: 2)')
+    parser.add_argument('-r', '--limit-rate',
+                        help='Total download rate for all jobs together, e.g. 500K or 4.2M (default: unlimited)')
+    parser.add_argument('-N', '--concurrent-fragments', type=int, default=1,
+                        help='Fragments of a DASH/HLS video downloaded in parallel (default: 1)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='Metadata cache file')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL,
+                        help=f'Seconds extracted metadata stays valid (default: {DEFAULT_TTL})')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the metadata cache')
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_PATH, help='Download archive and job journal file')
+    parser.add_argument('--no-archive', action='store_true',
+                        help='Download even if already downloaded, without recording jobs')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the last interrupted job (URLs, quality and output directory)')
+
     args = parser.parse_args()
-    
-    downloader = YouTubeDownloaderCLI()
-    
+
+    rate_limit = None
+    if args.limit_rate:
+        rate_limit = yt_dlp.utils.parse_bytes(args.limit_rate)
+        if rate_limit is None:
+            parser.error(f'invalid rate limit: {args.limit_rate}')
+
+    archive = None if args.no_archive else DownloadArchive(args.archive)
+    if args.resume:
+        if archive is None:
+            parser.error('--resume needs the download archive')
+        job = archive.last_unfinished_job()
+        if job is None:
+            parser.error('no interrupted job to resume')
+        _, args.urls, args.quality, args.output = job
+    elif not args.urls:
+        parser.error('the following arguments are required: -u/--urls')
+
+    metadata_cache = None if args.no_cache else MetadataCache(args.cache, ttl=args.cache_ttl)
+    downloader = YouTubeDownloaderCLI(metadata_cache, jobs=args.jobs, per_host=args.per_host or None,
+                                      rate_limit=rate_limit, concurrent_fragments=args.concurrent_fragments,
+                                      archive=archive)
+
     if args.output:
         downloader.download_folder = args.output
         if not os.path.exists(args.output):
             os.makedirs(args.output)
-    
-    downloader.download_multiple(args.urls, args.quality)
+
+    report = downloader.download_multiple(args.urls, args.quality)
+    if report.failures:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
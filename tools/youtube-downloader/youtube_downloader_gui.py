@@ -4,8 +4,13 @@ import yt_dlp
 import os
 import subprocess
 from typing import Dict, List
-import threading
 import platform
+import queue
+
+from download_archive import DownloadArchive, GUI_JOB_ID
+from download_manager import DownloadManager, PRIORITY_HIGH, PRIORITY_NORMAL
+from metadata_cache import MetadataCache
+from url_resolver import URLResolver
 
 class YouTubeDownloader:
     def __init__(self, root):
@@ -14,16 +19,24 @@ class YouTubeDownloader:
         self.root.geometry("1000x600")
         
         self.videos: Dict[str, dict] = {}
-        self.ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-        }
+        # Pasted URLs are resolved off the Tk thread; cached videos need no network call
+        self.metadata_cache = MetadataCache()
+        self.url_resolver = URLResolver(max_workers=4, metadata_cache=self.metadata_cache)
+        # Rows inserted per refresh tick, so expanding a large channel never blocks the UI
+        self.max_rows_per_refresh = 50
+        
+        # Queued and running downloads; workers never touch Tk widgets directly
+        self.max_downloads = tk.IntVar(value=3)
+        self.download_manager = DownloadManager(self._download_video, self.max_downloads.get())
+        # Interval (ms) at which progress published by workers is applied to the tree
+        self.ui_refresh_interval = 200
         
-        # Store download threads
-        self.download_threads: Dict[str, threading.Thread] = {}
+        # Finished downloads are skipped; queued ones are journaled and restored on restart
+        self.archive = DownloadArchive()
         
         self._create_ui()
+        self._restore_queue()
+        self.root.after(self.ui_refresh_interval, self._refresh_progress)
         
     def _create_ui(self):
         """Create all UI elements with enhanced controls"""
@@ -70,9 +83,17 @@ class YouTubeDownloader:
         
         self.tree.pack(fill=tk.BOTH, expand=True)
         
-        # Download All button
-        ttk.Button(self.root, text="Download All Videos", 
-                  command=self._download_all).pack(pady=10)
+        # Download All button and concurrency limit
+        download_frame = ttk.Frame(self.root)
+        download_frame.pack(pady=10)
+        ttk.Button(download_frame, text="Download All Videos", 
+                  command=self._download_all).pack(side=tk.LEFT, padx=5)
+        ttk.Label(download_frame, text="Max downloads:").pack(side=tk.LEFT)
+        ttk.Spinbox(download_frame, from_=1, to=16, width=4,
+                    textvariable=self.max_downloads).pack(side=tk.LEFT, padx=2)
+        self.max_downloads.trace_add('write', lambda *args: self._update_max_downloads())
+        self.queue_label = ttk.Label(download_frame, text="")
+        self.queue_label.pack(side=tk.LEFT, padx=10)
         
         # Default download folder
         self.download_folder = os.path.expanduser("~/Downloads")
@@ -155,91 +176,159 @@ class YouTubeDownloader:
         return frame
         
     def _add_videos(self):
-        """Add videos from URL input to the list"""
+        """Resolve the pasted URLs in the background; rows are added as results arrive"""
         urls = self.url_text.get("1.0", tk.END).strip().split("\n")
-        
-        for url in urls:
-            if not url.strip():
-                continue
-                
-            try:
-                with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    video_id = info.get('id', str(hash(url)))
-                    
-                    self.videos[video_id] = {
-                        'info': info,
-                        'url': url,
-                        'custom_title': info.get('title'),
-                        'selected_quality': '720p'
-                    }
-                    
-                    # Insert with action buttons
-                    item = self.tree.insert("", tk.END, video_id,
-                                          values=(info.get('title'),
-                                                 '720p',
-                                                 "Pending",
-                                                 ""))
-                    
-                    # Add action buttons
-                    action_frame = self._create_action_buttons(video_id)
-                    self.tree.set(item, "Actions", "")
-                    
-                    # Position the action buttons in the Actions column
-                    bbox = self.tree.bbox(item, "#4")
-                    if bbox:  # Ensure bbox exists
-                        action_frame.place(x=bbox[0], y=bbox[1])
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Error adding video: {str(e)}")
-        
+        self.url_resolver.resolve(urls)
         self.url_text.delete("1.0", tk.END)
         
-    def _download_single(self, video_id):
-        """Download a single video"""
-        if video_id in self.download_threads and self.download_threads[video_id].is_alive():
+    def _insert_video(self, url, info, quality='720p', status=None, output_dir=None):
+        """Add a resolved video to the list (skipped if it is already there)"""
+        video_id = info.get('id') or str(hash(url))
+        if video_id in self.videos:
             return
             
-        thread = threading.Thread(target=self._download_video, args=(video_id,))
-        thread.daemon = True
-        self.download_threads[video_id] = thread
-        thread.start()
+        self.videos[video_id] = {
+            'info': info,
+            'url': url,
+            'custom_title': info.get('title') or url,
+            'selected_quality': quality,
+            'output_dir': output_dir
+        }
+        if status is None:
+            done = self.archive.is_done(url, quality, output_dir or self.download_folder)
+            status = "Downloaded" if done else "Pending"
+        
+        # Insert with action buttons
+        item = self.tree.insert("", tk.END, video_id,
+                              values=(info.get('title') or url,
+                                     quality,
+                                     status,
+                                     ""))
+        
+        # Add action buttons
+        action_frame = self._create_action_buttons(video_id)
+        self.tree.set(item, "Actions", "")
+        
+        # Position the action buttons in the Actions column
+        bbox = self.tree.bbox(item, "#4")
+        if bbox:  # Ensure bbox exists
+            action_frame.place(x=bbox[0], y=bbox[1])
+            
+    def _insert_resolved(self):
+        """Insert a bounded number of resolved videos per tick and report errors together"""
+        errors = []
+        for _ in range(self.max_rows_per_refresh):
+            try:
+                kind, url, payload = self.url_resolver.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'video':
+                self._insert_video(url, payload)
+            else:
+                errors.append(f"{url}: {payload}")
+        if errors:
+            # The dialog is modal: show it after this tick, not in the middle of it
+            message = "Error adding video:\n" + "\n".join(errors[:10])
+            self.root.after_idle(lambda: messagebox.showerror("Error", message))
+            
+    def _restore_queue(self):
+        """Re-add videos that were queued or downloading when the app last closed"""
+        for item in self.archive.unfinished_items(GUI_JOB_ID):
+            status = f"Error: {item['error']}" if item['status'] == 'failed' else "Interrupted"
+            self._insert_video(item['url'], {'id': item['video_id'], 'title': item['title']},
+                               quality=item['quality'], status=status, output_dir=item['output_dir'])
+            
+    def _queue_download(self, video_id, priority):
+        """Journal the video with its current settings and queue it"""
+        video_data = self.videos[video_id]
+        # Keep the folder of an interrupted download so its partial file is continued
+        video_data['output_dir'] = video_data.get('output_dir') or self.download_folder
+        self.archive.add_item(GUI_JOB_ID, video_data['url'], video_data['selected_quality'],
+                              video_data['output_dir'], video_id, video_data['custom_title'])
+        self.download_manager.enqueue(video_id, priority)
+        
+    def _download_single(self, video_id):
+        """Download a single video ahead of the rest of the queue"""
+        self._queue_download(video_id, PRIORITY_HIGH)
         
     def _download_all(self):
-        """Download all videos in the list"""
-        for video_id in self.videos.keys():
-            self._download_single(video_id)
+        """Queue all videos in the list, in list order"""
+        for video_id in self.tree.get_children():
+            if video_id in self.videos and not self.download_manager.is_active(video_id):
+                self._queue_download(video_id, PRIORITY_NORMAL)
+                
+    def _update_max_downloads(self):
+        """Apply the concurrency limit from the spinbox (typed or arrow buttons)"""
+        try:
+            self.download_manager.set_max_concurrency(self.max_downloads.get())
+        except tk.TclError:
+            pass
+            
+    def _refresh_progress(self):
+        """Apply resolved videos and the latest status of each download to the tree, once per tick"""
+        # Schedule the next tick first so a dialog or an error in this one does not stop the updates
+        self.root.after(self.ui_refresh_interval, self._refresh_progress)
+        self._insert_resolved()
+        for video_id, status in self.download_manager.drain().items():
+            if self.tree.exists(video_id):
+                self.tree.set(video_id, "Status", status)
+        running, queued = self.download_manager.counts()
+        resolving = self.url_resolver.pending
+        counts = []
+        if resolving:
+            counts.append(f"Resolving: {resolving}")
+        if running or queued:
+            counts.append(f"Downloading: {running}  Queued: {queued}")
+        self.queue_label.config(text="  ".join(counts))
             
     def _download_video(self, video_id):
-        """Download individual video with progress tracking"""
+        """Download individual video with progress tracking (runs in a worker thread)"""
+        video_data = self.videos[video_id]
+        url = video_data['url']
         try:
-            video_data = self.videos[video_id]
             quality = video_data['selected_quality']
             custom_title = video_data['custom_title']
+            output_dir = video_data.get('output_dir') or self.download_folder
+            if self.archive.is_done(url, quality, output_dir):
+                self.archive.update_item(GUI_JOB_ID, url, 'done')
+                self.download_manager.publish(video_id, "Downloaded")
+                return
+            self.archive.update_item(GUI_JOB_ID, url, 'downloading')
+            self.download_manager.publish(video_id, "Starting")
             
             def progress_hook(d):
-                if d['status'] == 'downloading' and 'total_bytes' in d:
-                    progress = (d['downloaded_bytes'] / d['total_bytes']) * 100
-                    self.tree.set(video_id, "Status", f"{progress:.1f}%")
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if d['status'] == 'downloading' and total:
+                    progress = (d['downloaded_bytes'] / total) * 100
+                    self.download_manager.publish(video_id, f"{progress:.1f}%")
                 
             ydl_opts = {
-                'format': f'bestvideo[height<={quality[:-1]}]+bestaudio/best[height<={quality[:-1]}]',
-                'outtmpl': os.path.join(self.download_folder, f'{custom_title}.%(ext)s'),
+                'format': f'bestvideo[height<=?{quality[:-1]}]+bestaudio/best[height<=?{quality[:-1]}]',
+                'outtmpl': os.path.join(output_dir, f'{custom_title}.%(ext)s'),
                 'progress_hooks': [progress_hook],
+                'noprogress': True,
             }
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([video_data['url']])
+                result = ydl.extract_info(url, download=True)
                 
-            self.tree.set(video_id, "Status", "Completed")
+            downloads = result.get('requested_downloads') or [{}]
+            self.archive.record(url, result, quality, output_dir, downloads[0].get('filepath'))
+            self.archive.update_item(GUI_JOB_ID, url, 'done')
+            self.download_manager.publish(video_id, "Completed")
             
         except Exception as e:
-            self.tree.set(video_id, "Status", f"Error: {str(e)}")
+            self.archive.update_item(GUI_JOB_ID, url, 'failed', str(e))
+            self.download_manager.publish(video_id, f"Error: {str(e)}")
             
     def _remove_video(self, video_id):
         """Remove video from the list"""
+        self.download_manager.cancel(video_id)
+        self.url_resolver.forget(video_id)
         self.tree.delete(video_id)
-        self.videos.pop(video_id, None)
+        video_data = self.videos.pop(video_id, None)
+        if video_data:
+            self.archive.remove_item(GUI_JOB_ID, video_data['url'])
         
     def _select_folder(self):
         """Open dialog to select download folder"""